@@ -9,6 +9,9 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_limiter.errors import RateLimitExceeded
 
+from .upstream import upstream_pool
+from .database import database_uri, engine_options, enable_sqlite_pragmas
+
 basedir = os.path.abspath(os.path.dirname(__file__))
 instance_dir = os.path.join(basedir, "..", "instance")
 os.makedirs(instance_dir, exist_ok=True)
@@ -22,32 +25,39 @@ migrate = Migrate()
 def create_app():
     app = Flask(__name__)
     app.config["SECRET_KEY"] = "replace-this-with-a-strong-secret"
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    # SQLite en instance/app.db salvo que se defina DATABASE_URL (p. ej. PostgreSQL)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri(f"sqlite:///{db_path}")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 
     db.init_app(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
+    upstream_pool.init_app(app)
+    # Orígenes del frontend; el proxy ASGI también los usa para validar los WebSocket
+    app.config["CORS_ORIGINS"] = [
+        "http://192.168.191.100:3000",
+        "http://172.18.0.3:3000",
+        "http://localhost:3000",
+        "http://10.80.3.10:3000",
+        "http://10.80.3.200:3000",
+        "https://10.80.3.200:3000",
+        "http://10.0.1.100:3000",
+        "https://10.0.1.100:3000"
+    ]
     CORS(
         app,
         supports_credentials=True,
         resources={
             r"/*": {
-                "origins": [
-                    "http://192.168.191.100:3000",
-                    "http://172.18.0.3:3000",
-                    "http://localhost:3000",
-                    "http://10.80.3.10:3000",
-                    "http://10.80.3.200:3000",
-                    "https://10.80.3.200:3000",
-                    "http://10.0.1.100:3000",
-                    "https://10.0.1.100:3000"
-                ]
+                "origins": app.config["CORS_ORIGINS"]
             }
         },
     )
 
     # Configurar Flask-Limiter sin pasar el app en el constructor
-    limiter = Limiter(key_func=get_remote_address, default_limits=["800 per minute"])
+    # (el proxy ASGI aplica el mismo límite a sus rutas)
+    app.config["RATELIMIT_DEFAULT"] = "800 per minute"
+    limiter = Limiter(key_func=get_remote_address, default_limits=[app.config["RATELIMIT_DEFAULT"]])
     limiter.init_app(app)
 
     # Personalizar la respuesta cuando se exceda el límite
@@ -61,17 +71,45 @@ def create_app():
         )
 
     with app.app_context():
+        # Antes de la primera conexión: WAL, busy timeout, etc. (solo SQLite)
+        enable_sqlite_pragmas(app, db.engine)
+
         # registro de blueprints y carga de ejercicios
         from .models import Exercise
+        from .locks import named_locks
+        from .placement import placement
+        from .container_registry import container_registry
+        from .warm_pool import warm_pool
+        from .jobs import container_jobs
+        from .reaper import container_reaper
+        from .teardown import container_teardown
+        from .admission import admission
+        from .activity import activity_tracker
+        from .port_allocator import port_allocator
+        from .user_import import user_importer
         from .proxy import proxy_blueprint
         from .auth import auth_blueprint
         from .exercise import exercise_blueprint
         from .question_blueprint import question_blueprint
+        from .metrics import metrics_blueprint
 
         app.register_blueprint(auth_blueprint)
         app.register_blueprint(exercise_blueprint)
         app.register_blueprint(proxy_blueprint)
         app.register_blueprint(question_blueprint)
+        app.register_blueprint(metrics_blueprint)
+
+        named_locks.init_app(app)
+        placement.init_app(app)
+        container_registry.init_app(app)
+        warm_pool.init_app(app)
+        container_jobs.init_app(app)
+        container_reaper.init_app(app)
+        container_teardown.init_app(app)
+        admission.init_app(app)
+        activity_tracker.init_app(app)
+        port_allocator.init_app(app)
+        user_importer.init_app(app)
 
         db.create_all()
 
@@ -110,4 +148,18 @@ def create_app():
             except json.JSONDecodeError as e:
                 print(f"Error al decodificar JSON: {str(e)}. No se crearon ejercicios.")
 
+        # Reservar los puertos de los ejercicios existentes y de los contenedores en ejecución
+        port_allocator.reconcile()
+
+        # Completar los pools precalentados (p. ej. tras reiniciar el backend)
+        warm_pool.refill_all()
+
+        # Eliminar los contenedores cuyo plazo venció (también los de antes del reinicio)
+        # y los que llevan demasiado tiempo sin actividad en el proxy
+        activity_tracker.start()
+        container_reaper.start()
+
+        # Despachar los inicios en cola a medida que se libera capacidad
+        admission.start()
+
     return app
@@ -0,0 +1,81 @@
+import datetime
+import os
+import threading
+
+from sqlalchemy import bindparam
+
+from .models import ContainerLease, db
+
+
+class ActivityTracker:
+    """
+    Registra la última actividad de cada contenedor a partir del tráfico del
+    proxy.
+
+    `touch` solo escribe en un dict en memoria (es lo único que se hace por
+    petición); un hilo vuelca el dict a `ContainerLease.last_activity` cada
+    `ACTIVITY_FLUSH_SECONDS` con un único UPDATE por lotes. Cada worker
+    vuelca lo suyo, y el eliminador de contenedores usa ese valor para
+    detener los que llevan `CONTAINER_IDLE_SECONDS` sin uso.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._pending = {}  # nombre -> datetime UTC
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        app.config.setdefault("ACTIVITY_FLUSH_SECONDS", int(os.getenv("ACTIVITY_FLUSH_SECONDS", "30")))
+        self.app = app
+        app.extensions["activity_tracker"] = self
+
+    def touch(self, container_name):
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            self._pending[container_name] = now
+
+    def last_seen(self, container_name):
+        """Actividad registrada en este worker y aún no volcada, si la hay."""
+        with self._lock:
+            return self._pending.get(container_name)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        lease_table = ContainerLease.__table__
+        stmt = (
+            lease_table.update()
+            .where(lease_table.c.container_name == bindparam("name"))
+            .values(last_activity=bindparam("seen"))
+        )
+        try:
+            db.session.execute(stmt, [{"name": name, "seen": seen} for name, seen in pending.items()])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Se reintenta en el próximo volcado, sin pisar actividad más reciente
+            with self._lock:
+                for name, seen in pending.items():
+                    self._pending.setdefault(name, seen)
+            raise
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.app.config["ACTIVITY_FLUSH_SECONDS"]):
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                self.app.logger.error(f"Failed to flush container activity: {str(e)}")
+
+
+activity_tracker = ActivityTracker()
@@ -0,0 +1,210 @@
+import datetime
+import os
+import threading
+from collections import Counter
+
+from sqlalchemy import func
+
+from .jobs import QUEUED_JOB_HEARTBEAT_TIMEOUT, container_jobs
+from .models import CapacityReservation, ContainerJob, ContainerLease, ExerciseWarmPool, db
+from .placement import LAB_CONTAINER_CPUS, LAB_CONTAINER_MEMORY_MB, placement
+
+
+class AdmissionController:
+    """
+    Control de admisión de inicios según la capacidad del host.
+
+    Cada contenedor de laboratorio reserva `LAB_CONTAINER_MEMORY_MB` de RAM y
+    `LAB_CONTAINER_CPUS` de CPU; con los presupuestos de cada host
+    (`HOST_MEMORY_BUDGET_MB`, `HOST_CPU_BUDGET`, por defecto calculados desde
+    `client.info()`, ver `placement`) eso da una cantidad de cupos. Ocupan cupo los
+    contenedores con plazo (`ContainerLease`), los inicios ya admitidos y los
+    contenedores precalentados configurados.
+
+    Los inicios que no caben esperan en una cola FIFO (los `ContainerJob` en
+    estado "queued" sin `admitted_at`). El plan de admisión se calcula desde
+    la base de datos, así que es el mismo en todos los workers; cada worker
+    despacha solo los trabajos que encoló él y mantiene su latido para que
+    los de un worker caído no bloqueen la cola.
+
+    Los administradores pueden reservar cupos para un ejercicio durante una
+    ventana de tiempo (`CapacityReservation`): esos cupos solo los usan los
+    inicios del ejercicio, que además pueden ocupar cupos generales en su
+    turno de la cola.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+
+    def init_app(self, app):
+        app.config.setdefault("ADMISSION_POLL_SECONDS", float(os.getenv("ADMISSION_POLL_SECONDS", "1")))
+        app.config.setdefault(
+            "ADMISSION_ENABLED",
+            os.getenv("ADMISSION_ENABLED", "true").lower() in ["true", "1", "yes"],
+        )
+        self.app = app
+        app.extensions["admission"] = self
+
+    @property
+    def enabled(self):
+        return self.app.config["ADMISSION_ENABLED"]
+
+    # -------------------------
+    #   CAPACIDAD
+    # -------------------------
+
+    @staticmethod
+    def host_slots():
+        """Contenedores de laboratorio que caben entre todos los hosts."""
+        return placement.total_slots()
+
+    @staticmethod
+    def active_reservations(now=None):
+        now = now or datetime.datetime.utcnow()
+        return (
+            CapacityReservation.query
+            .filter(CapacityReservation.starts_at <= now, CapacityReservation.ends_at > now)
+            .all()
+        )
+
+    def usage(self):
+        """Cupos ocupados por ejercicio y por el pool precalentado."""
+        used = Counter(dict(
+            db.session.query(ContainerLease.exercise_id, func.count(ContainerLease.id))
+            .group_by(ContainerLease.exercise_id)
+            .all()
+        ))
+        # Un inicio admitido ocupa cupo antes de tener plazo (y unos segundos ambas cosas)
+        used.update(dict(
+            db.session.query(ContainerJob.exercise_id, func.count(ContainerJob.id))
+            .filter(
+                ContainerJob.action == "start",
+                ContainerJob.active_key.isnot(None),
+                ContainerJob.admitted_at.isnot(None),
+            )
+            .group_by(ContainerJob.exercise_id)
+            .all()
+        ))
+        warm = db.session.query(func.coalesce(func.sum(ExerciseWarmPool.size), 0)).scalar()
+        return used, int(warm)
+
+    def plan(self):
+        """
+        Recorre la cola en orden y retorna (admitibles, posiciones): los ids
+        de trabajos que ya caben y la posición (desde 1) de los que esperan.
+        """
+        now = datetime.datetime.utcnow()
+        used, warm = self.usage()
+        reserved_free = {}
+        general_used = warm
+        reserved_total = 0
+        reservations = Counter()
+        for reservation in self.active_reservations(now):
+            reservations[reservation.exercise_id] += reservation.slots
+        for exercise_id, slots in reservations.items():
+            reserved_total += slots
+            reserved_free[exercise_id] = max(0, slots - used[exercise_id])
+            general_used += max(0, used[exercise_id] - slots)
+        general_used += sum(count for exercise_id, count in used.items() if exercise_id not in reservations)
+        general_free = max(0, self.host_slots() - reserved_total - general_used)
+
+        stale = now - datetime.timedelta(seconds=QUEUED_JOB_HEARTBEAT_TIMEOUT)
+        waiting = (
+            ContainerJob.query
+            .with_entities(ContainerJob.id, ContainerJob.exercise_id)
+            .filter(
+                ContainerJob.active_key.isnot(None),
+                ContainerJob.admitted_at.is_(None),
+                ContainerJob.updated_at >= stale,
+            )
+            .order_by(ContainerJob.created_at, ContainerJob.id)
+            .all()
+        )
+        admissible, positions = set(), {}
+        for job_id, exercise_id in waiting:
+            if reserved_free.get(exercise_id, 0) > 0:
+                reserved_free[exercise_id] -= 1
+                admissible.add(job_id)
+            elif general_free > 0:
+                general_free -= 1
+                admissible.add(job_id)
+            else:
+                positions[job_id] = len(positions) + 1
+        return admissible, positions
+
+    def queue_position(self, job_id):
+        """Posición en la cola (0 si ya puede iniciar)."""
+        _, positions = self.plan()
+        return positions.get(job_id, 0)
+
+    def summary(self):
+        used, warm = self.usage()
+        _, positions = self.plan()
+        hosts = placement.summary()
+        return {
+            "memory_budget_mb": sum(host["memory_budget_mb"] for host in hosts),
+            "cpu_budget": sum(host["cpu_budget"] for host in hosts),
+            "container_memory_mb": LAB_CONTAINER_MEMORY_MB,
+            "container_cpus": LAB_CONTAINER_CPUS,
+            "slots": self.host_slots(),
+            "in_use": sum(used.values()) + warm,
+            "warm_pool": warm,
+            "queued": len(positions),
+            "hosts": hosts,
+        }
+
+    # -------------------------
+    #   DESPACHO
+    # -------------------------
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is not None or not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if container_jobs.deferred_ids():
+                    with self.app.app_context():
+                        self.dispatch_admitted()
+            except Exception as e:
+                self.app.logger.error(f"Admission dispatch failed: {str(e)}")
+            self._wakeup.wait(self.app.config["ADMISSION_POLL_SECONDS"])
+            self._wakeup.clear()
+
+    def dispatch_admitted(self):
+        """Renueva el latido de los trabajos locales en cola y despacha los que caben."""
+        local = container_jobs.deferred_ids()
+        now = datetime.datetime.utcnow()
+        jobs = ContainerJob.query.filter(ContainerJob.id.in_(local)).all()
+        waiting = set()
+        for job in jobs:
+            if job.active_key is None or job.admitted_at is not None:
+                continue
+            job.updated_at = now
+            waiting.add(job.id)
+        db.session.commit()
+        for job_id in set(local) - waiting:
+            # Se dio por fallido (p. ej. por inactividad) mientras esperaba
+            container_jobs.discard(job_id)
+
+        admissible, _ = self.plan()
+        for job_id in waiting & admissible:
+            admitted = (
+                ContainerJob.query
+                .filter(ContainerJob.id == job_id, ContainerJob.admitted_at.is_(None))
+                .update({"admitted_at": now, "updated_at": now}, synchronize_session=False)
+            )
+            db.session.commit()
+            if admitted:
+                container_jobs.dispatch(job_id)
+
+
+admission = AdmissionController()
@@ -0,0 +1,253 @@
+import csv
+import io
+import json
+
+from sqlalchemy.orm import aliased
+
+from .models import (
+    ExerciseAnswer, ExerciseGroup, ExerciseQuestion,
+    GroupExerciseAnswer, User, db
+)
+
+# Máximo de respuestas por página con `limit`
+ANSWERS_PAGE_MAX = 1000
+
+# Filas que se traen de la base de datos por vez al exportar
+EXPORT_BATCH_SIZE = 500
+# Bytes que se juntan antes de enviar un bloque de la exportación
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_COLUMNS = [
+    'kind', 'answer_id', 'exercise_id', 'question_id', 'question_text',
+    'user_id', 'user_email', 'group_id', 'leader_email', 'partner_email',
+    'answer_text', 'score', 'max_score', 'feedback',
+]
+
+# Una celda que empieza así se evalúa como fórmula al abrir el CSV en una planilla
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+Leader = aliased(User, name="leader")
+Partner = aliased(User, name="partner")
+
+
+class PageArgsError(ValueError):
+    """Parámetros de paginación, proyección o exportación inválidos."""
+
+
+def individual_answers_query(exercise_id=None):
+    """
+    Respuestas individuales del ejercicio (o de todos, con None) con su
+    pregunta y el correo del alumno, en una sola consulta (ordenadas por id
+    para paginar).
+    """
+    query = (
+        db.session.query(
+            ExerciseAnswer.id.label('answer_id'),
+            ExerciseAnswer.answer_text,
+            ExerciseAnswer.score,
+            ExerciseAnswer.feedback,
+            ExerciseQuestion.id.label('question_id'),
+            ExerciseQuestion.question_text,
+            ExerciseQuestion.exercise_id,
+            ExerciseQuestion.score.label('max_score'),
+            ExerciseAnswer.user_id,
+            User.email.label('user_email')
+        )
+        .join(ExerciseQuestion, ExerciseQuestion.id == ExerciseAnswer.question_id)
+        .outerjoin(User, User.id == ExerciseAnswer.user_id)
+        .order_by(ExerciseAnswer.id)
+    )
+    if exercise_id is not None:
+        query = query.filter(ExerciseQuestion.exercise_id == exercise_id)
+    return query
+
+
+def group_answers_query(exercise_id=None):
+    """
+    Respuestas grupales del ejercicio (o de todos, con None) con su
+    pregunta, el grupo y los correos del líder y del compañero (alias de
+    `User`), en una sola consulta.
+    """
+    query = (
+        db.session.query(
+            GroupExerciseAnswer.id.label('answer_id'),
+            GroupExerciseAnswer.answer_text,
+            GroupExerciseAnswer.score,
+            ExerciseQuestion.id.label('question_id'),
+            ExerciseQuestion.question_text,
+            ExerciseQuestion.score.label('max_score'),
+            ExerciseGroup.exercise_id,
+            ExerciseGroup.id.label('group_id'),
+            Leader.email.label('leader_email'),
+            Partner.email.label('partner_email')
+        )
+        .join(ExerciseQuestion, ExerciseQuestion.id == GroupExerciseAnswer.question_id)
+        .join(ExerciseGroup, ExerciseGroup.id == GroupExerciseAnswer.group_id)
+        .outerjoin(Leader, Leader.id == ExerciseGroup.leader_id)
+        .outerjoin(Partner, Partner.id == ExerciseGroup.partner_id)
+        .order_by(GroupExerciseAnswer.id)
+    )
+    if exercise_id is not None:
+        query = query.filter(ExerciseGroup.exercise_id == exercise_id)
+    return query
+
+
+def parse_page_args(args):
+    """
+    Lee de la query string `limit`, `individual_after`, `group_after`,
+    `kind` (individual | group) y `fields` (lista separada por comas).
+    Sin `limit` se retorna todo, como siempre.
+    """
+    def optional_int(name):
+        value = args.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise PageArgsError(f"'{name}' must be an integer")
+
+    limit = optional_int('limit')
+    if limit is not None and not 1 <= limit <= ANSWERS_PAGE_MAX:
+        raise PageArgsError(f"'limit' must be between 1 and {ANSWERS_PAGE_MAX}")
+    kind = args.get('kind') or None
+    if kind not in (None, 'individual', 'group'):
+        raise PageArgsError("'kind' must be 'individual' or 'group'")
+    fields = [f.strip() for f in (args.get('fields') or '').split(',') if f.strip()]
+    return {
+        'limit': limit,
+        'individual_after': optional_int('individual_after'),
+        'group_after': optional_int('group_after'),
+        'kind': kind,
+        'fields': set(fields) or None,
+    }
+
+
+def keyset_page(query, id_column, after, limit):
+    """
+    Aplica la paginación por clave (`id > after`) y retorna (filas,
+    siguiente cursor); el cursor es None en la última página.
+    """
+    if after is not None:
+        query = query.filter(id_column > after)
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].answer_id
+    return rows, None
+
+
+def project(item, fields):
+    """Deja solo las claves pedidas en `fields` (todas si es None)."""
+    if not fields:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+
+def answers_listing(individual_query, group_query, page, individual_item, group_item):
+    """
+    Arma la respuesta de los listados de administración: ambas listas (o
+    solo la de `kind`), cada elemento armado con `*_item(row)` y
+    proyectado a `fields`, y `next_cursor` cuando se pagina.
+    """
+    result = {}
+    cursors = {}
+    if page['kind'] in (None, 'individual'):
+        rows, cursors['individual_after'] = keyset_page(
+            individual_query, ExerciseAnswer.id, page['individual_after'], page['limit']
+        )
+        result['individual_answers'] = [project(individual_item(row), page['fields']) for row in rows]
+    if page['kind'] in (None, 'group'):
+        rows, cursors['group_after'] = keyset_page(
+            group_query, GroupExerciseAnswer.id, page['group_after'], page['limit']
+        )
+        result['group_answers'] = [project(group_item(row), page['fields']) for row in rows]
+    if page['limit'] is not None:
+        result['next_cursor'] = cursors
+    return result
+
+
+# -------------------------
+#   EXPORTACIÓN
+# -------------------------
+
+def parse_export_args(args):
+    """
+    Lee `format` (csv | ndjson), `exercise_id`, `question_id` y `graded`
+    (true | false) de la query string.
+    """
+    fmt = (args.get('format') or 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        raise PageArgsError("'format' must be 'csv' or 'ndjson'")
+    filters = {}
+    for name in ('exercise_id', 'question_id'):
+        value = args.get(name)
+        if value in (None, ''):
+            filters[name] = None
+            continue
+        try:
+            filters[name] = int(value)
+        except ValueError:
+            raise PageArgsError(f"'{name}' must be an integer")
+    graded = (args.get('graded') or '').lower()
+    if graded not in ('', 'true', 'false'):
+        raise PageArgsError("'graded' must be 'true' or 'false'")
+    filters['graded'] = None if not graded else graded == 'true'
+    return fmt, filters
+
+
+def export_rows(exercise_id=None, question_id=None, graded=None):
+    """
+    Genera las respuestas individuales y luego las grupales como dicts con
+    `EXPORT_COLUMNS`, leyendo de a `EXPORT_BATCH_SIZE` filas.
+    """
+    sources = (
+        ('individual', individual_answers_query(exercise_id), ExerciseAnswer),
+        ('group', group_answers_query(exercise_id), GroupExerciseAnswer),
+    )
+    for kind, query, model in sources:
+        if question_id is not None:
+            query = query.filter(model.question_id == question_id)
+        if graded is not None:
+            query = query.filter(model.score.isnot(None) if graded else model.score.is_(None))
+        for row in query.yield_per(EXPORT_BATCH_SIZE):
+            item = dict.fromkeys(EXPORT_COLUMNS)
+            item.update(row._asdict())
+            item['kind'] = kind
+            yield item
+
+
+def csv_safe(value):
+    """Antepone `'` a los textos que una planilla interpretaría como fórmula."""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({key: csv_safe(value) for key, value in row.items()})
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(rows):
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps({key: row[key] for key in EXPORT_COLUMNS}, ensure_ascii=False) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
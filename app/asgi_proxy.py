@@ -0,0 +1,466 @@
+import asyncio
+import html
+import os
+import re
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from limits import parse as parse_rate_limit
+from websockets.asyncio.client import connect as websocket_connect
+from websockets.exceptions import ConnectionClosed
+
+from .activity import activity_tracker
+from .asset_cache import asset_cache
+from .compression import compression
+from .container_registry import container_registry
+from .exercise import decode_session_token
+from .metrics import ProxyTimer
+from .proxy import HOP_BY_HOP_HEADERS, RequestBodyTooLarge, html_response_headers, render_html
+
+PROXY_PATH_RE = re.compile(r"^/api/exercise/(\d+)/proxy(?:/(.*))?$")
+
+# Cabeceras del handshake que `websockets` genera por su cuenta
+WEBSOCKET_HANDSHAKE_HEADERS = HOP_BY_HOP_HEADERS + [
+    'host', 'sec-websocket-key', 'sec-websocket-version',
+    'sec-websocket-extensions', 'sec-websocket-protocol',
+]
+WEBSOCKET_MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+class AsyncExerciseProxy:
+    """
+    Aplicación ASGI para el modo asíncrono del proxy.
+
+    Atiende `/api/exercise/<id>/proxy/<path>` (HTTP y WebSocket) en el event
+    loop, de modo que una petición lenta o de long-polling no ocupa un worker
+    completo. Usa la misma autenticación por cookie (`session_token`), el
+    mismo nombre de contenedor y la misma reescritura de HTML que el proxy
+    WSGI. Cualquier otra ruta se delega a la aplicación Flask.
+
+    Como las rutas del proxy no pasan por Flask, aquí se aplica el límite de
+    peticiones por IP de Flask-Limiter (`RATELIMIT_DEFAULT`, con su mismo
+    almacenamiento), y un WebSocket solo se acepta si su `Origin` es uno de
+    `CORS_ORIGINS` o el propio host: la cookie de sesión viaja también en
+    los handshakes que abre cualquier otro sitio.
+    """
+
+    def __init__(self, flask_app):
+        config = flask_app.config
+        config.setdefault("ASGI_PROXY_MAX_CONNECTIONS", int(os.getenv("ASGI_PROXY_MAX_CONNECTIONS", "2000")))
+        config.setdefault("ASGI_PROXY_MAX_KEEPALIVE", int(os.getenv("ASGI_PROXY_MAX_KEEPALIVE", "200")))
+        config.setdefault("ASGI_PROXY_READ_TIMEOUT", float(os.getenv("ASGI_PROXY_READ_TIMEOUT", "300")))
+
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.allowed_origins = set(config["CORS_ORIGINS"])
+        self.rate_limiter = next(iter(flask_app.extensions["limiter"])).limiter
+        self.rate_limit = parse_rate_limit(config["RATELIMIT_DEFAULT"])
+        self.secret_key = config["SECRET_KEY"]
+        self.max_body_size = config["PROXY_MAX_BODY_SIZE"]
+        self.connect_timeout = config["PROXY_CONNECT_TIMEOUT"]
+        self.read_timeout = config["ASGI_PROXY_READ_TIMEOUT"]
+        self.limits = httpx.Limits(
+            max_connections=config["ASGI_PROXY_MAX_CONNECTIONS"],
+            max_keepalive_connections=config["ASGI_PROXY_MAX_KEEPALIVE"],
+        )
+        self.http = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+
+        match = PROXY_PATH_RE.match(scope["path"])
+        if match is None:
+            if scope["type"] == "http":
+                return await self.wsgi(scope, receive, send)
+            return await send({"type": "websocket.close", "code": 1008})
+
+        exercise_id = int(match.group(1))
+        path = match.group(2) or ""
+        if scope["type"] == "websocket":
+            if not self._within_rate_limit(scope):
+                return await send({"type": "websocket.close", "code": 1008})
+            return await self._proxy_websocket(scope, receive, send, exercise_id, path)
+
+        if not self._within_rate_limit(scope):
+            return await self._send_json_error(
+                send, 429, "Límite de peticiones excedido. Intente de nuevo más tarde."
+            )
+        timer = ProxyTimer(scope["method"])
+        try:
+            await self._proxy_http(scope, receive, timer.wrap_send(send), exercise_id, path, timer)
+        finally:
+            timer.finish()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.http is not None:
+                    await self.http.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _client(self):
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                follow_redirects=False,
+                trust_env=False,
+            )
+        return self.http
+
+    # -------------------------
+    #   AUTENTICACIÓN
+    # -------------------------
+
+    def _decode_session(self, scope):
+        cookie = SimpleCookie()
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                try:
+                    cookie.load(value.decode("latin-1"))
+                except CookieError:
+                    pass
+        morsel = cookie.get("session_token")
+        return decode_session_token(morsel.value if morsel else "", self.secret_key)
+
+    def _within_rate_limit(self, scope):
+        """Cuenta la petición para la IP del cliente; False si superó el límite."""
+        client = scope.get("client") or ("127.0.0.1", 0)
+        return self.rate_limiter.hit(self.rate_limit, "asgi_proxy", client[0])
+
+    @staticmethod
+    def _header(scope, name):
+        for key, value in scope["headers"]:
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+    def _origin_allowed(self, scope):
+        """
+        Indica si el handshake viene del frontend o de una página del propio
+        host (la del laboratorio). Sin `Origin` no es un navegador, que
+        siempre lo envía.
+        """
+        origin = self._header(scope, b"origin")
+        if origin is None or origin in self.allowed_origins:
+            return True
+        return urlsplit(origin).netloc == self._header(scope, b"host")
+
+    def _lookup_container(self, name):
+        # Una búsqueda en vivo consulta en la base de datos en qué host está el contenedor
+        with self.flask_app.app_context():
+            return container_registry.lookup(name)
+
+    async def _resolve_container(self, scope, exercise_id, timer=None):
+        """
+        Retorna (ContainerInfo, error), donde `error` es una tupla
+        (status, mensaje) si la petición no se puede reenviar.
+        """
+        timer = timer or ProxyTimer(None)
+        with timer.stage("jwt_decode"):
+            decoded = self._decode_session(scope)
+        if not decoded:
+            return None, (401, "Unauthorized")
+
+        container_name = f"user-{decoded['user_id']}-exercise-{exercise_id}"
+        try:
+            with timer.stage("container_lookup"):
+                info = await asyncio.to_thread(self._lookup_container, container_name)
+        except Exception as e:
+            self.flask_app.logger.error(f"Container lookup failed for {container_name}: {str(e)}")
+            return None, (404, "An internal error occurred")
+        if info is None:
+            return None, (404, "Container not found")
+        timer.exercise = str(exercise_id)
+        activity_tracker.touch(container_name)
+        if not info.ip:
+            return None, (500, "No container IP found")
+        return info, None
+
+    # -------------------------
+    #   HTTP
+    # -------------------------
+
+    async def _send_json_error(self, send, status, message):
+        body = ('{"error": "%s"}' % message).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _request_body(self, receive, timer):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            timer.request_bytes += len(chunk)
+            if timer.request_bytes > self.max_body_size:
+                raise RequestBodyTooLarge()
+            if chunk:
+                yield chunk
+            if not message.get("more_body", False):
+                return
+
+    async def _proxy_http(self, scope, receive, send, exercise_id, path, timer):
+        container, error = await self._resolve_container(scope, exercise_id, timer)
+        if error:
+            return await self._send_json_error(send, *error)
+
+        headers = []
+        content_length = None
+        chunked = False
+        for name, value in scope["headers"]:
+            lower = name.decode("latin-1").lower()
+            if lower == "content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    return await self._send_json_error(send, 400, "Invalid Content-Length header")
+            elif lower == "transfer-encoding":
+                chunked = True
+                continue
+            if lower != "host":
+                headers.append((name.decode("latin-1"), value.decode("latin-1")))
+
+        if content_length is not None and content_length > self.max_body_size:
+            return await self._send_json_error(send, 413, "Request body too large")
+        has_body = chunked or bool(content_length)
+
+        safe_path = html.escape(path)
+        url = f"http://{container.ip}:5000/{safe_path}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+
+        # Static assets shared by every container built from the same image
+        request_headers = httpx.Headers(headers)
+        response_encoding = compression.negotiate(request_headers.get("accept-encoding"))
+        asset_key = None
+        cached_asset = None
+        if asset_cache.is_cacheable_request(scope["method"], request_headers):
+            with timer.stage("asset_cache"):
+                asset_key = asset_cache.key(
+                    exercise_id, container.id, safe_path,
+                    scope.get("query_string", b""), request_headers.get("accept-encoding"),
+                )
+                cached_asset = asset_cache.get(asset_key)
+            if cached_asset is not None and cached_asset.is_fresh():
+                return await self._send_asset(send, cached_asset, request_headers)
+            if cached_asset is not None:
+                # Revalidamos la copia vencida con los validadores del contenedor
+                headers = [(k, v) for k, v in headers if k.lower() not in ("if-none-match", "if-modified-since")]
+                if cached_asset.etag:
+                    headers.append(("If-None-Match", cached_asset.etag))
+                if cached_asset.last_modified:
+                    headers.append(("If-Modified-Since", cached_asset.last_modified))
+
+        client = self._client()
+        try:
+            upstream_request = client.build_request(
+                scope["method"],
+                url,
+                headers=headers,
+                content=self._request_body(receive, timer) if has_body else None,
+            )
+            with timer.stage("upstream_request"):
+                resp = await client.send(upstream_request, stream=True)
+
+            is_html = "text/html" in resp.headers.get("content-type", "")
+            if is_html and resp.status_code == 206 and scope["method"] in ("GET", "HEAD"):
+                # Un rango parcial de HTML no se puede reescribir: pedimos el documento completo
+                await resp.aclose()
+                headers = [(k, v) for k, v in headers if k.lower() not in ("range", "if-range")]
+                with timer.stage("upstream_request"):
+                    resp = await client.send(client.build_request(scope["method"], url, headers=headers), stream=True)
+                is_html = "text/html" in resp.headers.get("content-type", "")
+
+            if is_html:
+                return await self._send_html(send, resp, exercise_id, safe_path, response_encoding, timer)
+
+            if cached_asset is not None and resp.status_code == 304:
+                await resp.aclose()
+                asset_cache.refresh(asset_key, cached_asset, resp.headers)
+                return await self._send_asset(send, cached_asset, request_headers)
+
+            content_length = resp.headers.get("content-length", "")
+            if (
+                asset_key is not None
+                and content_length.isdigit()
+                and int(content_length) <= asset_cache.max_item_bytes
+                and asset_cache.freshness_lifetime(resp.status_code, resp.headers) is not None
+            ):
+                try:
+                    with timer.stage("upstream_request"):
+                        asset_body = b"".join([chunk async for chunk in resp.aiter_raw()])
+                finally:
+                    await resp.aclose()
+                asset_headers = list(resp.headers.multi_items())
+                if response_encoding and compression.should_compress(resp.status_code, asset_headers, len(asset_body)):
+                    # Se guarda ya comprimido: la clave incluye el Accept-Encoding del cliente
+                    asset_body = compression.compress(asset_body, response_encoding)
+                    asset_headers = compression.encoded_headers(asset_headers, response_encoding)
+                    asset_headers.append(("content-length", str(len(asset_body))))
+                asset = asset_cache.put(asset_key, resp.status_code, asset_headers, asset_body)
+                return await self._send_asset(send, asset, request_headers)
+        except RequestBodyTooLarge:
+            return await self._send_json_error(send, 413, "Request body too large")
+        except httpx.TimeoutException as e:
+            self.flask_app.logger.error(f"Upstream timeout for exercise {exercise_id}: {str(e)}")
+            return await self._send_json_error(send, 504, "The exercise container did not respond in time")
+        except httpx.HTTPError as e:
+            self.flask_app.logger.error(f"RequestException occurred: {str(e)}")
+            return await self._send_json_error(send, 502, "An internal error occurred")
+
+        await self._stream_response(send, resp, response_encoding)
+
+    async def _stream_response(self, send, resp, response_encoding):
+        headers = [
+            (name, value) for name, value in resp.headers.multi_items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        ]
+        compressor = None
+        if response_encoding and compression.should_compress(resp.status_code, headers):
+            headers = compression.encoded_headers(headers, response_encoding)
+            compressor = compression.stream_compressor(response_encoding)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": resp.status_code,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            })
+            async for chunk in resp.aiter_raw():
+                if compressor is not None:
+                    chunk = compressor.compress_chunk(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": compressor.finish() if compressor else b""})
+        finally:
+            await resp.aclose()
+
+    async def _send_asset(self, send, asset, request_headers):
+        if asset_cache.not_modified(asset, request_headers):
+            status, headers, body = 304, asset_cache.not_modified_headers(asset), b""
+        else:
+            status, headers, body = asset.status, asset.headers, asset.body
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_html(self, send, resp, exercise_id, safe_path, response_encoding, timer):
+        try:
+            with timer.stage("upstream_request"):
+                body = await resp.aread()
+        finally:
+            await resp.aclose()
+
+        headers = html_response_headers(resp.headers.multi_items())
+        if not (response_encoding and compression.should_compress(resp.status_code, headers, len(body))):
+            response_encoding = None
+        else:
+            headers = compression.encoded_headers(headers, response_encoding)
+
+        # La reescritura usa CPU: se hace fuera del event loop
+        with timer.stage("html_rewrite"):
+            content = await asyncio.to_thread(
+                self._render_html, exercise_id, safe_path, body, resp.encoding, response_encoding
+            )
+        headers.append(("Content-Length", str(len(content))))
+        await send({
+            "type": "http.response.start",
+            "status": resp.status_code,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    @staticmethod
+    def _render_html(exercise_id, safe_path, body, encoding, response_encoding):
+        content = render_html(exercise_id, safe_path, body, encoding)
+        content = content if isinstance(content, bytes) else b"".join(content)
+        if response_encoding:
+            content = compression.compress(content, response_encoding)
+        return content
+
+    # -------------------------
+    #   WEBSOCKET
+    # -------------------------
+
+    async def _proxy_websocket(self, scope, receive, send, exercise_id, path):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        if not self._origin_allowed(scope):
+            self.flask_app.logger.warning(
+                f"Rejected WebSocket to exercise {exercise_id} from origin {self._header(scope, b'origin')}"
+            )
+            return await send({"type": "websocket.close", "code": 1008})
+
+        container, error = await self._resolve_container(scope, exercise_id)
+        if error:
+            # Cerrar antes de aceptar responde 403 al handshake
+            return await send({"type": "websocket.close", "code": 1008})
+
+        url = f"ws://{container.ip}:5000/{html.escape(path)}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = [
+            (name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]
+            if name.decode("latin-1").lower() not in WEBSOCKET_HANDSHAKE_HEADERS
+        ]
+
+        try:
+            upstream = await websocket_connect(
+                url,
+                additional_headers=headers,
+                subprotocols=scope.get("subprotocols") or None,
+                open_timeout=self.connect_timeout,
+                max_size=WEBSOCKET_MAX_MESSAGE_SIZE,
+            )
+        except Exception as e:
+            self.flask_app.logger.error(f"WebSocket upgrade to exercise {exercise_id} failed: {str(e)}")
+            return await send({"type": "websocket.close", "code": 1011})
+
+        await send({"type": "websocket.accept", "subprotocol": upstream.subprotocol})
+
+        async def client_to_upstream():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                # Una sesión abierta cuenta como actividad solo si el alumno envía algo
+                activity_tracker.touch(container.name)
+                if message.get("text") is not None:
+                    await upstream.send(message["text"])
+                elif message.get("bytes") is not None:
+                    await upstream.send(message["bytes"])
+
+        async def upstream_to_client():
+            try:
+                async for data in upstream:
+                    if isinstance(data, str):
+                        await send({"type": "websocket.send", "text": data})
+                    else:
+                        await send({"type": "websocket.send", "bytes": data})
+            except ConnectionClosed:
+                pass
+            await send({"type": "websocket.close", "code": upstream.close_code or 1000})
+
+        tasks = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
@@ -0,0 +1,177 @@
+import os
+import time
+from dataclasses import dataclass
+
+from .cache import BoundedLRU
+
+CACHEABLE_TYPES = (
+    "text/css", "text/javascript", "application/javascript", "application/x-javascript",
+    "image/", "font/", "application/font-woff", "application/vnd.ms-fontobject",
+)
+
+# Cabeceras de la respuesta original que no se guardan con el recurso
+UNCACHED_HEADERS = [
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'date', 'age',
+]
+
+
+@dataclass
+class CachedAsset:
+    status: int
+    headers: list
+    body: bytes
+    etag: str
+    last_modified: str
+    expires_at: float
+
+    def is_fresh(self):
+        return time.monotonic() < self.expires_at
+
+
+def header_items(headers):
+    """Acepta un objeto tipo dict o una lista de pares (nombre, valor)."""
+    return headers.items() if hasattr(headers, "items") else headers
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+class AssetCache:
+    """
+    Caché de recursos estáticos (CSS, JS, imágenes, fuentes) de los
+    contenedores de los alumnos.
+
+    La clave incluye el id del contenedor: un alumno puede modificar los
+    archivos de su contenedor (subidas, terminal web), así que lo que
+    responde uno no se sirve a los demás. Un contenedor nuevo con el mismo
+    nombre tiene otro id, y `invalidate_exercise` libera las entradas de un
+    ejercicio al reconstruir su imagen. Se respetan `Cache-Control` y `ETag`/`Last-Modified`
+    del contenedor, y las peticiones condicionales de un recurso vigente se
+    responden con 304 sin contactar al contenedor.
+    """
+
+    def __init__(self):
+        self.store = BoundedLRU()
+        self.default_ttl = 300
+
+    def init_app(self, app):
+        app.config.setdefault("ASSET_CACHE_MAX_BYTES", int(os.getenv("ASSET_CACHE_MAX_BYTES", str(128 * 1024 * 1024))))
+        app.config.setdefault("ASSET_CACHE_MAX_ITEM_BYTES", int(os.getenv("ASSET_CACHE_MAX_ITEM_BYTES", str(4 * 1024 * 1024))))
+        app.config.setdefault("ASSET_CACHE_DEFAULT_TTL", int(os.getenv("ASSET_CACHE_DEFAULT_TTL", "300")))
+        self.store.configure(app.config["ASSET_CACHE_MAX_BYTES"], app.config["ASSET_CACHE_MAX_ITEM_BYTES"])
+        self.default_ttl = app.config["ASSET_CACHE_DEFAULT_TTL"]
+        app.extensions["asset_cache"] = self
+
+    @property
+    def max_item_bytes(self):
+        return self.store.max_item_bytes
+
+    @staticmethod
+    def key(exercise_id, container_id, path, query_string, accept_encoding):
+        return (exercise_id, container_id, path, query_string, accept_encoding or "")
+
+    @staticmethod
+    def is_cacheable_request(method, request_headers):
+        return method == "GET" and not request_headers.get("Range") and not request_headers.get("Authorization")
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def freshness_lifetime(self, status, headers):
+        """
+        Segundos que la respuesta puede servirse sin revalidar, o None si no
+        se puede guardar en una caché compartida.
+        """
+        if status != 200:
+            return None
+        headers = {name.lower(): value for name, value in header_items(headers)}
+        content_type = headers.get("content-type", "").lower()
+        if not any(content_type.startswith(t) for t in CACHEABLE_TYPES):
+            return None
+        if headers.get("set-cookie"):
+            return None
+        # Solo Accept-Encoding forma parte de la clave
+        vary = headers.get("vary", "").lower().replace(" ", "")
+        if vary and vary != "accept-encoding":
+            return None
+
+        directives = parse_cache_control(headers.get("cache-control"))
+        if "no-store" in directives or "private" in directives:
+            return None
+        if "no-cache" in directives:
+            return 0
+        for name in ("s-maxage", "max-age"):
+            if name in directives:
+                try:
+                    return max(0, int(directives[name]))
+                except ValueError:
+                    return 0
+        if headers.get("etag") or headers.get("last-modified"):
+            # Archivo estático sin caducidad explícita: la imagen no cambia
+            # hasta reconstruirse, así que usamos un TTL heurístico
+            return self.default_ttl
+        return None
+
+    def put(self, key, status, headers, body):
+        """
+        Guarda la respuesta si sus cabeceras lo permiten. `headers` puede ser
+        un objeto tipo dict o una lista de pares (nombre, valor).
+        """
+        ttl = self.freshness_lifetime(status, headers)
+        if ttl is None:
+            return None
+        stored = [(n, v) for n, v in header_items(headers) if n.lower() not in UNCACHED_HEADERS]
+        validators = {n.lower(): v for n, v in stored}
+        asset = CachedAsset(
+            status=status,
+            headers=stored,
+            body=body,
+            etag=validators.get("etag"),
+            last_modified=validators.get("last-modified"),
+            expires_at=time.monotonic() + ttl,
+        )
+        self.store.put(key, asset, len(body))
+        return asset
+
+    def refresh(self, key, asset, headers):
+        """Renueva la vigencia de `asset` tras una revalidación 304."""
+        merged = {n.lower(): v for n, v in asset.headers}
+        merged.update({n.lower(): v for n, v in header_items(headers)})
+        ttl = self.freshness_lifetime(asset.status, merged)
+        if ttl is None:
+            self.store.discard(key)
+            return
+        asset.expires_at = time.monotonic() + ttl
+
+    @staticmethod
+    def not_modified(asset, request_headers):
+        """Indica si la petición condicional del cliente se puede responder con 304."""
+        if_none_match = request_headers.get("If-None-Match")
+        if if_none_match:
+            if not asset.etag:
+                return False
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            weak = asset.etag[2:] if asset.etag.startswith("W/") else asset.etag
+            return "*" in tags or any(tag in (asset.etag, weak, "W/" + weak) for tag in tags)
+        if_modified_since = request_headers.get("If-Modified-Since")
+        return bool(if_modified_since and asset.last_modified and if_modified_since == asset.last_modified)
+
+    @staticmethod
+    def not_modified_headers(asset):
+        return [
+            (n, v) for n, v in asset.headers
+            if n.lower() in ("etag", "last-modified", "cache-control", "expires", "vary", "content-location")
+        ]
+
+    def invalidate_exercise(self, exercise_id):
+        self.store.discard_where(lambda key: key[0] == exercise_id)
+
+
+asset_cache = AssetCache()
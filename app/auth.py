@@ -4,7 +4,11 @@ import secrets
 from flask import Blueprint, request, jsonify, current_app, make_response
 from . import db, bcrypt
 from .models import User
-from .exercise import decode_token, client
+from .exercise import decode_token
+from .placement import placement
+from .reaper import container_reaper
+from .teardown import container_teardown
+from .user_import import UserImportError, user_importer
 
 auth_blueprint = Blueprint('auth', __name__)
 
@@ -81,18 +85,23 @@ def login():
 def logout_user():
     """
     Cierra la sesión basada en la cookie 'session_token'.
-    Remueve contenedores activos de ese usuario y vacía la cookie.
+    Remueve (en segundo plano) los contenedores de ese usuario y vacía la cookie.
     """
     decoded = decode_token()
     if not decoded:
         return jsonify({'error': 'Unauthorized'}), 401
 
     user_id = decoded.get('user_id')
-    containers = client.containers.list(all=True, filters={"name": f"user-{user_id}-"})
-    for container in containers:
-        container.remove(force=True)
-
-    response = make_response(jsonify({"message": "Logged out and containers removed."}))
+    containers = placement.list_containers(all=True, filters={"name": f"user-{user_id}-"})
+    # El filtro de Docker es por subcadena: "user-1-" también coincide con "user-11-"
+    names = [c.name for _, c in containers if c.name.startswith(f"user-{user_id}-")]
+    container_reaper.release(*names)
+    batch = container_teardown.submit(names, "logout", requested_by=user_id)
+
+    response = make_response(jsonify({
+        "message": "Logged out; containers are being removed.",
+        "teardown_id": batch.id,
+    }))
     response.set_cookie('session_token', '', expires=0, secure=True, httponly=True, samesite='Strict')  # Borrar cookie
     return response
 
@@ -172,6 +181,9 @@ def get_user():
 def bulk_create_users():
     """
     Crea varios usuarios en masa. Debe ser llamado por un admin (token en Authorization).
+    Acepta JSON (`{"users": [{"email", "first_name", "last_name"}, ...]}`),
+    NDJSON (un usuario por línea) o CSV (en el cuerpo o como archivo `file`).
+    Los correos ya registrados se omiten y se informan en `skipped`.
     """
     # Verificar token y admin
     token = request.headers.get('Authorization', '').replace('Bearer ', '')
@@ -189,40 +201,16 @@ def bulk_create_users():
     if not admin_user or not admin_user.is_admin:
         return jsonify({'error': 'Forbidden'}), 403
 
-    data = request.json  # Estructura: {"users": [ { "email": "...", "first_name": "...", "last_name": "..." }, ... ]}
-    users_list = data.get('users', [])
-
-    created_users = []
-    for u in users_list:
-        email = u.get('email')
-        first_name = u.get('first_name', '')
-        last_name = u.get('last_name', '')
-
-        # Generar contraseña aleatoria
-        temp_password = secrets.token_urlsafe(8)
-
-        # Si el usuario ya existe, se salta
-        if User.query.filter_by(email=email).first():
-            continue
-
-        new_user = User(
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-            force_password_change=True  # Obligará a cambiar en su 1er login
-        )
-        new_user.set_password(temp_password)
-        db.session.add(new_user)
-        db.session.commit()
-
-        created_users.append({
-            "email": email,
-            "temp_password": temp_password
-        })
-    
+    try:
+        users_list = user_importer.parse(request)
+    except UserImportError as e:
+        return jsonify({'error': str(e)}), 400
+
+    created_users, skipped = user_importer.import_users(users_list)
     return jsonify({
         "message": "Usuarios creados",
-        "created": created_users
+        "created": created_users,
+        "skipped": skipped
     }), 201
 
 
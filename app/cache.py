@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+
+class BoundedLRU:
+    """
+    Caché LRU en memoria, acotada por cantidad total de bytes.
+
+    Cada entrada declara su tamaño al guardarse; al superar `max_bytes` se
+    descartan las entradas usadas hace más tiempo. Las entradas mayores a
+    `max_item_bytes` no se guardan. Lleva contadores de aciertos, fallos y
+    descartes para exponerlos como métricas.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_item_bytes=2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_bytes, max_item_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.max_item_bytes = max_item_bytes
+            self._shrink_locked()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """
+        Guarda `value` bajo `key`. Si no se indica `size` se usa `len(value)`.
+        Retorna False si la entrada es demasiado grande para la caché.
+        """
+        if size is None:
+            size = len(value)
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            self._shrink_locked()
+        return True
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def discard_where(self, predicate):
+        """Elimina todas las entradas cuya clave cumpla `predicate`."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _shrink_locked(self):
+        while self._size > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
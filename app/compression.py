@@ -0,0 +1,170 @@
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/x-javascript", "application/json",
+    "application/xml", "application/xhtml+xml", "application/rss+xml", "image/svg+xml",
+)
+# Eventos pequeños y de larga duración (SSE): se reenvían tal cual
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def parse_accept_encoding(value):
+    """Retorna un dict {codificación: q} a partir de la cabecera Accept-Encoding."""
+    accepted = {}
+    for part in (value or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class StreamCompressor:
+    """Compresor incremental con la misma interfaz para gzip y brotli."""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        if self.encoding == "br":
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def flush(self):
+        """Entrega lo que el compresor retiene, sin cerrar el flujo."""
+        if self.encoding == "br":
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def compress_chunk(self, chunk):
+        """Comprime `chunk` y lo entrega completo (para respuestas en streaming)."""
+        return self.compress(chunk) + self.flush()
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionPolicy:
+    """
+    Negociación de compresión para las respuestas del proxy.
+
+    Elige brotli (si está instalado) o gzip según el `Accept-Encoding` del
+    cliente, y solo comprime tipos de texto cuyo tamaño supere
+    `PROXY_COMPRESSION_MIN_SIZE`. Los niveles por defecto priorizan CPU
+    sobre tasa de compresión, ya que se comprime en cada respuesta.
+    """
+
+    def __init__(self):
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+
+    def init_app(self, app):
+        app.config.setdefault("PROXY_COMPRESSION_MIN_SIZE", int(os.getenv("PROXY_COMPRESSION_MIN_SIZE", "1024")))
+        app.config.setdefault("PROXY_GZIP_LEVEL", int(os.getenv("PROXY_GZIP_LEVEL", "6")))
+        app.config.setdefault("PROXY_BROTLI_QUALITY", int(os.getenv("PROXY_BROTLI_QUALITY", "4")))
+        self.min_size = app.config["PROXY_COMPRESSION_MIN_SIZE"]
+        self.gzip_level = app.config["PROXY_GZIP_LEVEL"]
+        self.brotli_quality = app.config["PROXY_BROTLI_QUALITY"]
+        app.extensions["compression"] = self
+
+    def negotiate(self, accept_encoding):
+        """Retorna 'br', 'gzip' o None según lo que acepta el cliente."""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0)
+        if brotli is not None and accepted.get("br", wildcard) > 0:
+            return "br"
+        if accepted.get("gzip", wildcard) > 0:
+            return "gzip"
+        return None
+
+    def should_compress(self, status, headers, length=None):
+        """
+        Indica si una respuesta sin comprimir vale la pena comprimirla.
+        `length` es el tamaño conocido del cuerpo, si lo hay.
+        """
+        if status in (204, 206, 304) or status < 200:
+            return False
+        headers = {name.lower(): value for name, value in headers}
+        if headers.get("content-encoding", "identity").lower() != "identity":
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        content_type = headers.get("content-type", "").lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES) or content_type.startswith(UNCOMPRESSED_TYPES):
+            return False
+        if length is None and headers.get("content-length", "").isdigit():
+            length = int(headers["content-length"])
+        return length is None or length >= self.min_size
+
+    @staticmethod
+    def encoded_headers(headers, encoding):
+        """
+        Ajusta las cabeceras de una respuesta que se enviará comprimida: sin
+        Content-Length ni Accept-Ranges, con Content-Encoding, `Vary:
+        Accept-Encoding` y el ETag marcado como débil.
+        """
+        result = []
+        vary = None
+        for name, value in headers:
+            lower = name.lower()
+            if lower in ("content-length", "accept-ranges", "content-encoding"):
+                continue
+            if lower == "etag" and not value.startswith("W/"):
+                value = "W/" + value
+            if lower == "vary":
+                vary = value
+                continue
+            result.append((name, value))
+        if vary is None:
+            vary = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            vary += ", Accept-Encoding"
+        result.append(("Vary", vary))
+        result.append(("Content-Encoding", encoding))
+        return result
+
+    def stream_compressor(self, encoding):
+        return StreamCompressor(encoding, self.brotli_quality if encoding == "br" else self.gzip_level)
+
+    def compress(self, data, encoding):
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def compress_stream(self, chunks, encoding):
+        """
+        Comprime un iterable de bloques de bytes a medida que se consume.
+        Cada bloque se vacía del compresor al enviarlo, para que el cliente
+        reciba los datos de una respuesta larga (long-poll) sin esperar el final.
+        """
+        compressor = self.stream_compressor(encoding)
+        for chunk in chunks:
+            out = compressor.compress_chunk(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+
+
+compression = CompressionPolicy()
@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import docker
+
+from .placement import placement
+from .upstream import upstream_pool
+
+LAB_CONTAINER_RE = re.compile(r"^user-(\d+)-exercise-(\d+)$")
+
+
+@dataclass
+class ContainerInfo:
+    name: str
+    id: str
+    status: str
+    ip: Optional[str]
+    image: Optional[str] = None
+    host: Optional[str] = None
+
+
+def ip_from_attrs(attrs):
+    """
+    Retorna la IP del contenedor en su primera red, o None si no tiene.
+    """
+    networks = (attrs.get("NetworkSettings") or {}).get("Networks") or {}
+    if not networks:
+        return None
+    first_network = list(networks.keys())[0]
+    return networks[first_network].get("IPAddress") or None
+
+
+def info_from_container(container, host=None):
+    return ContainerInfo(
+        name=container.name,
+        id=container.id,
+        status=container.status,
+        ip=ip_from_attrs(container.attrs),
+        image=container.attrs.get("Image"),
+        host=host.name if host else None,
+    )
+
+
+class ContainerRegistry:
+    """
+    Registro en memoria de los contenedores de laboratorio
+    (`user-{id}-exercise-{id}`) con su IP y estado.
+
+    Se llena una vez al iniciar y luego se mantiene al día siguiendo el
+    stream de eventos de cada daemon de Docker (ver `placement`), de modo
+    que el proxy no consulta la API en cada petición. Si un nombre no está
+    en el registro (o el stream de eventos de su host está caído) se hace
+    una consulta en vivo.
+    """
+
+    def __init__(self):
+        self._by_name = {}
+        self._names_by_id = {}
+        self._lock = threading.Lock()
+        self._synced = {}  # host -> threading.Event
+        self._threads = []
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "CONTAINER_REGISTRY_WATCH",
+            os.getenv("CONTAINER_REGISTRY_WATCH", "true").lower() in ["true", "1", "yes"],
+        )
+        app.extensions["container_registry"] = self
+        if app.config["CONTAINER_REGISTRY_WATCH"]:
+            self.start_watcher(app.logger)
+
+    # -------------------------
+    #   CONSULTAS
+    # -------------------------
+
+    def lookup(self, name):
+        """
+        Retorna el `ContainerInfo` de `name` o None si el contenedor no existe.
+        """
+        with self._lock:
+            info = self._by_name.get(name)
+        if info is not None and self._is_synced(info.host):
+            return info
+        return self.refresh(name)
+
+    def _is_synced(self, host_name):
+        synced = self._synced.get(host_name)
+        return synced is not None and synced.is_set()
+
+    def refresh(self, name_or_id, host=None):
+        """
+        Consulta el contenedor en vivo y actualiza el registro. Sin `host`
+        se busca en el host registrado para el nombre (o en todos).
+        """
+        if host is None:
+            host, container = placement.find(name_or_id)
+        else:
+            try:
+                container = host.client.containers.get(name_or_id)
+            except docker.errors.NotFound:
+                container = None
+        if container is None:
+            self.forget(name_or_id)
+            return None
+        info = info_from_container(container, host)
+        if LAB_CONTAINER_RE.match(info.name):
+            self._store(info)
+        return info
+
+    def forget(self, name_or_id):
+        with self._lock:
+            name = self._names_by_id.pop(name_or_id, name_or_id)
+            info = self._by_name.pop(name, None)
+            if info is not None:
+                self._names_by_id.pop(info.id, None)
+        if info is not None and info.ip:
+            upstream_pool.evict(info.ip)
+
+    def _store(self, info):
+        with self._lock:
+            previous = self._by_name.get(info.name)
+            self._by_name[info.name] = info
+            self._names_by_id[info.id] = info.name
+        if previous is not None and previous.ip and previous.ip != info.ip:
+            upstream_pool.evict(previous.ip)
+
+    # -------------------------
+    #   EVENTOS DE DOCKER
+    # -------------------------
+
+    def start_watcher(self, logger):
+        if self._threads:
+            return
+        for host in placement.hosts():
+            self._synced[host.name] = threading.Event()
+            thread = threading.Thread(target=self._watch, args=(host, logger), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _bootstrap(self, host):
+        containers = host.client.containers.list(all=True, filters={"name": "user-"})
+        with self._lock:
+            for name, info in list(self._by_name.items()):
+                if info.host == host.name:
+                    del self._by_name[name]
+                    self._names_by_id.pop(info.id, None)
+        for container in containers:
+            if LAB_CONTAINER_RE.match(container.name):
+                self._store(info_from_container(container, host))
+
+    def _watch(self, host, logger):
+        synced = self._synced[host.name]
+        while True:
+            try:
+                # Abrimos el stream antes de listar para no perder eventos
+                events = host.client.events(
+                    decode=True,
+                    since=int(time.time()),
+                    filters={"type": ["container", "network"]},
+                )
+                self._bootstrap(host)
+                synced.set()
+                for event in events:
+                    self._handle_event(host, event)
+            except Exception as e:
+                logger.error(f"Container registry lost the Docker event stream of {host.name}: {str(e)}")
+            synced.clear()
+            time.sleep(5)
+
+    def _handle_event(self, host, event):
+        action = event.get("Action", "")
+        actor = event.get("Actor") or {}
+        attributes = actor.get("Attributes") or {}
+
+        if event.get("Type") == "network":
+            container_id = attributes.get("container")
+            if container_id and action in ("connect", "disconnect"):
+                with self._lock:
+                    known = container_id in self._names_by_id
+                if known or action == "connect":
+                    self.refresh(container_id, host)
+            return
+
+        container_id = actor.get("ID")
+        name = attributes.get("name", "")
+
+        if action == "rename":
+            self.forget(attributes.get("oldName", "").lstrip("/"))
+        if not LAB_CONTAINER_RE.match(name):
+            return
+
+        if action == "destroy":
+            self.forget(container_id)
+        elif action in ("start", "rename", "pause", "unpause"):
+            self.refresh(container_id, host)
+        elif action == "die":
+            with self._lock:
+                info = self._by_name.get(name)
+            if info is not None:
+                self._store(ContainerInfo(info.name, info.id, "exited", None, info.image, info.host))
+
+
+container_registry = ContainerRegistry()
@@ -1,39 +1,57 @@
+import datetime
 import jwt
-from flask import Blueprint, jsonify, request, current_app
-import docker
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
 import os
 import re
 import zipfile
 import shutil
 from werkzeug.utils import secure_filename
-import threading
 import time
+import requests
+from sqlalchemy.exc import IntegrityError
 
 from .models import (
     Exercise,
     ExerciseAnswer,
-    ExerciseQuestion,
     User,
     db,
     ExerciseGroup,
     GroupExerciseAnswer,
+    ExerciseWarmPool,
+    TeardownBatch,
+    CapacityReservation,
+)
+from .jobs import container_jobs, ContainerJobFailed, ACTIVE_STATES
+from .upstream import upstream_pool
+from .container_registry import container_registry
+from .asset_cache import asset_cache
+from .image_cache import image_build_cache
+from .warm_pool import warm_pool, warm_container_name
+from .placement import placement, HostUnavailable, LAB_CONTAINER_OPTIONS
+from .reaper import container_reaper
+from .teardown import container_teardown, remove_container
+from .admission import admission
+from .port_allocator import port_allocator, PortUnavailable
+from .locks import named_locks
+from .answers import (
+    PageArgsError, answers_listing, export_rows, group_answers_query,
+    individual_answers_query, parse_export_args, parse_page_args,
+    stream_csv, stream_ndjson
 )
  
 exercise_blueprint = Blueprint('exercise', __name__)
-client = docker.from_env()
 
-def decode_token():
+def decode_session_token(token, secret_key):
     """
-    Lee el JWT desde la cookie 'session_token'.
-    Si la cookie no está o el token es inválido/expirado, retorna None.
+    Decodifica el JWT de sesión con la clave indicada.
+    Si el token falta o es inválido/expirado, retorna None.
     """
-    token = request.cookies.get('session_token', '')
     if not token:
         return None
     try:
         return jwt.decode(
             token, 
-            current_app.config['SECRET_KEY'], 
+            secret_key, 
             algorithms=['HS256']
         )
     except jwt.ExpiredSignatureError:
@@ -41,31 +59,13 @@ def decode_token():
     except jwt.InvalidTokenError:
         return None
 
-def get_free_port():
-    """
-    Retorna el primer puerto libre entre 8000 y 9999
-    que no esté siendo usado por ningún ejercicio en la base de datos.
-    """
-    used_ports = [ex.port for ex in Exercise.query.all()]
-    for candidate in range(8000, 10000):
-        if candidate not in used_ports:
-            return candidate
-    raise RuntimeError("No free ports available in the specified range")
-
-def get_used_ports_by_containers():
+def decode_token():
     """
-    Retorna un set con los puertos HostPort que actualmente
-    están mapeados por contenedores en ejecución.
+    Lee el JWT desde la cookie 'session_token'.
+    Si la cookie no está o el token es inválido/expirado, retorna None.
     """
-    used = set()
-    for container in client.containers.list():
-        ports_info = container.attrs["NetworkSettings"]["Ports"] or {}
-        for port_spec, host_data in ports_info.items():
-            if host_data:
-                for binding in host_data:
-                    if binding.get("HostPort"):
-                        used.add(int(binding["HostPort"]))
-    return used
+    token = request.cookies.get('session_token', '')
+    return decode_session_token(token, current_app.config['SECRET_KEY'])
 
 def safe_extract(zip_file, extract_path):
     """
@@ -80,34 +80,6 @@ def safe_extract(zip_file, extract_path):
             raise Exception("Zip Slip detected: " + member.filename)
     zip_file.extractall(extract_path)
 
-def kill_container_after(name, seconds):
-    time.sleep(seconds)
-    try:
-        container = client.containers.get(name)
-        container.reload()
-        
-        # Si sigue en estado 'running' o 'restarting', lo detenemos
-        if container.status in ['running', 'restarting']:
-            container.stop()
-            container.wait()  # Asegura que termine de parar
-
-        # Intentamos remover
-        container.remove()
-        print(f"{name} was stopped and removed after {seconds} seconds")
-
-    except docker.errors.NotFound:
-        # El contenedor ya no existe (probablemente alguien más lo removió)
-        pass
-    except docker.errors.APIError as e:
-        # Manejar el caso "removal of container ... is already in progress"
-        if "removal of container" in str(e) and "is already in progress" in str(e):
-            # Docker ya lo está eliminando, no hacemos nada extra
-            current_app.logger.info(f"Ignoring error for container '{name}': {str(e)}")
-            pass
-        else:
-            # Errores distintos al 409 se relanzan
-            raise
-
 # -------------------------
 #     RUTAS DE LECTURA
 # -------------------------
@@ -163,7 +135,11 @@ def get_exercise_detail(exercise_id):
 def get_exercise_status(exercise_id):
     """
     Devuelve { "status": "running" } o { "status": "stopped" } 
-    según el estado real del contenedor (o 404 si no existe).
+    según el estado real del contenedor (o "not_found" si no existe).
+    Mientras hay un inicio o una detención en curso, `status` es el estado
+    del trabajo (queued/building/starting/stopping) y `job` trae su detalle
+    (con `queue_position` mientras espera capacidad en el host).
+    `idle_warning` indica que el contenedor se detendrá pronto por inactividad.
     """
     decoded = decode_token()
     if not decoded:
@@ -172,20 +148,162 @@ def get_exercise_status(exercise_id):
     user_id = decoded['user_id']
     container_name = f"user-{user_id}-exercise-{exercise_id}"
 
+    job = container_jobs.latest_job(user_id, exercise_id)
+    job_data = None
+    if job is not None:
+        if job.active_key is not None:
+            # Descarta trabajos que quedaron colgados (p. ej. tras un reinicio)
+            job = container_jobs.active_job(user_id, exercise_id) or job
+        job_data = {'id': job.id, 'action': job.action, 'state': job.state, 'error': job.error}
+        if job.state in ACTIVE_STATES:
+            if job.active_key is not None and job.admitted_at is None:
+                # Esperando capacidad: 0 = por iniciar
+                job_data['queue_position'] = admission.queue_position(job.id)
+            return jsonify({'status': job.state, 'job': job_data})
+
     try:
-        container = client.containers.get(container_name)
-        container.reload()
-        return jsonify({"status": container.status})
-    except docker.errors.NotFound:
-        return jsonify({"status": "not_found"}), 200
+        info = container_registry.lookup(container_name)
+    except HostUnavailable as e:
+        current_app.logger.error(str(e))
+        return jsonify({'error': 'The Docker host of this container is unavailable'}), 503
+    status = info.status if info is not None else "not_found"
+    deadline = container_reaper.deadline(container_name) if info is not None else None
+    expires_at = deadline['expires_at'] if deadline else None
+    idle_expires_at = deadline['idle_expires_at'] if deadline else None
+    return jsonify({
+        'status': status,
+        'job': job_data,
+        'expires_at': expires_at.isoformat() + 'Z' if expires_at else None,
+        # Aviso previo a detener el contenedor por inactividad (se evita con /extend)
+        'idle_expires_at': idle_expires_at.isoformat() + 'Z' if idle_expires_at else None,
+        'idle_warning': deadline['idle_warning'] if deadline else False,
+    })
 
 
 # -------------------------
 #   INICIAR/DETENER CONTAINER
 # -------------------------
 
+def wait_until_ready(container_name, timeout):
+    """
+    Espera a que la aplicación del contenedor responda por HTTP (con
+    cualquier código) o a que pasen `timeout` segundos.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = container_registry.refresh(container_name)
+        if info is None or info.status != "running":
+            return False
+        if info.ip:
+            try:
+                upstream_pool.request(info.ip, "GET", f"http://{info.ip}:5000/", timeout=1).close()
+                return True
+            except requests.exceptions.RequestException:
+                pass
+        time.sleep(0.5)
+    return False
+
+def start_container_job(job, progress):
+    """
+    Construye la imagen (si cambió) y lanza el contenedor del alumno.
+    Corre en el pool de `container_jobs`; `progress` actualiza el estado.
+    """
+    exercise = Exercise.query.get(job.exercise_id)
+    if not exercise:
+        raise RuntimeError(f"Exercise {job.exercise_id} no longer exists")
+
+    container_name = f"user-{job.user_id}-exercise-{job.exercise_id}"
+    # Un inicio o detención del mismo contenedor en otro worker (p. ej. un
+    # trabajo dado por vencido que sigue corriendo) termina antes; luego se
+    # reutiliza lo que dejó, porque un contenedor que ya corre es "ready"
+    with named_locks.hold(container_name):
+        # Verificar si ya existe un contenedor (en cualquiera de los hosts)
+        _, existing_container = placement.find(container_name)
+        if existing_container is not None:
+            if existing_container.status == "running":
+                return "ready"
+            # Si estaba detenido, forzar su eliminación para crear uno nuevo
+            existing_container.remove(force=True)
+            placement.forget(container_name)
+
+        # Tomar un contenedor precalentado de la versión vigente del ejercicio
+        image_tag = f"exercise-{job.exercise_id}"
+        build_path = exercise.dockerfile_path
+        context_hash = image_build_cache.context_hash(build_path)
+        _, container = warm_pool.claim(job.exercise_id, context_hash, container_name)
+        if container is not None:
+            progress("starting")
+        else:
+            # O correr uno nuevo, con límites de recursos, en el host con menos carga
+            host = placement.choose()
+            placement.remember(container_name, host)
+            try:
+                with container_jobs.daemon_slot(host.client):
+                    # Construir la imagen en base a la carpeta dockerfile_path (solo si cambió)
+                    progress("building")
+                    image, rebuilt = image_build_cache.ensure_image(host.client, image_tag, build_path)
+                    if rebuilt:
+                        # La imagen cambió: los recursos estáticos guardados ya no sirven
+                        asset_cache.invalidate_exercise(job.exercise_id)
+
+                    progress("starting")
+                    host.client.containers.run(
+                        image.id,
+                        detach=True,
+                        name=container_name,
+                        **LAB_CONTAINER_OPTIONS
+                    )
+            except Exception:
+                placement.forget(container_name)
+                raise
+        if ExerciseWarmPool.query.filter(ExerciseWarmPool.exercise_id == job.exercise_id, ExerciseWarmPool.size > 0).first():
+            warm_pool.refill_async(job.exercise_id)
+
+        # El contenedor se eliminará al vencer su plazo (2 horas por defecto)
+        container_reaper.schedule(container_name, job.user_id, job.exercise_id)
+
+    timeout = current_app.config["CONTAINER_READY_TIMEOUT"]
+    if not wait_until_ready(container_name, timeout):
+        # No queda como "running" un contenedor que no atiende: se elimina para
+        # que el estado informe la falla y el alumno pueda iniciarlo de nuevo
+        with named_locks.hold(container_name):
+            remove_container(container_name)
+            container_reaper.release(container_name)
+        raise ContainerJobFailed(f"The exercise container stopped or did not respond within {timeout} seconds")
+    return "ready"
+
+def stop_container_job(job, progress):
+    """Detiene y elimina el contenedor del alumno."""
+    progress("stopping")
+    container_name = f"user-{job.user_id}-exercise-{job.exercise_id}"
+    with named_locks.hold(container_name):
+        host, container = placement.find(container_name)
+        if container is not None:
+            with container_jobs.daemon_slot(host.client):
+                upstream_pool.evict_container(container)
+                container.stop()
+                container.remove()
+        container_reaper.release(container_name)
+        placement.forget(container_name)
+    return "stopped"
+
+def job_response(job, created, message):
+    """Respuesta 202 de un trabajo de inicio o detención recién encolado (o en curso)."""
+    return jsonify({
+        'message': message if created else f'{job.action.capitalize()} already in progress',
+        'job_id': job.id,
+        'status': job.state,
+        'queue_position': admission.queue_position(job.id) if job.admitted_at is None else None,
+        'proxy_url': f'/api/exercise/{job.exercise_id}/proxy'
+    }), 202
+
 @exercise_blueprint.route('/api/exercise/<int:exercise_id>/start', methods=['POST'])
 def start_exercise(exercise_id):
+    """
+    Encola el inicio del contenedor y responde 202 con el id del trabajo;
+    el progreso se consulta en `/api/exercise/<id>/status`. Si el host está
+    lleno, el inicio espera en la cola de admisión (`queue_position`).
+    """
     decoded = decode_token()
     if not decoded:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -207,49 +325,43 @@ def start_exercise(exercise_id):
     if group and group.leader_id != user_id:
         return jsonify({'message': 'El contenedor ya fue lanzado por tu compañero'}), 403
 
+    container_name = f"user-{user_id}-exercise-{exercise_id}"
     try:
-        container_name = f"user-{user_id}-exercise-{exercise_id}"
-        # Verificar si ya existe un contenedor
-        try:
-            existing_container = client.containers.get(container_name)
-            if existing_container.status == "running":
-                return jsonify({
-                    'message': f'Exercise {exercise_id} is already running',
-                    'proxy_url': f'/api/exercise/{exercise_id}/proxy'
-                })
-            else:
-                # Si estaba detenido, forzar su eliminación para crear uno nuevo
-                existing_container.remove(force=True)
-        except docker.errors.NotFound:
-            pass
-
-        # Construir la imagen en base a la carpeta dockerfile_path
-        image_tag = f"exercise-{exercise_id}"
-        build_path = exercise.dockerfile_path
-        client.images.build(path=build_path, tag=image_tag)
-
-        # Correr el contenedor con límites de recursos
-        container = client.containers.run(
-            image_tag,
-            detach=True,
-            name=container_name,
-            network="lab_app_net",
-            mem_limit="512m",        # Máximo 512 MB de RAM
-            nano_cpus=500000000      # ~0.5 CPU
-        )
-
-        # Crear un hilo que matará el contenedor luego de 2 horas (7200 segundos)
-        t = threading.Thread(target=kill_container_after, args=(container_name, 7200))
-        t.daemon = True
-        t.start()
-
+        info = container_registry.lookup(container_name)
+    except HostUnavailable as e:
+        current_app.logger.error(str(e))
+        return jsonify({'error': 'The Docker host of this container is unavailable'}), 503
+    if info is not None and info.status == "running" and not container_jobs.active_job(user_id, exercise_id):
         return jsonify({
-            'message': f'Exercise {exercise_id} started successfully',
+            'message': f'Exercise {exercise_id} is already running',
             'proxy_url': f'/api/exercise/{exercise_id}/proxy'
         })
-    except docker.errors.APIError as e:
-        current_app.logger.error(f"Failed to start container: {str(e)}")
-        return jsonify({'error': 'An internal error occurred while starting the container.'}), 500
+
+    job, created = container_jobs.submit(
+        user_id, exercise_id, "start", start_container_job, deferred=admission.enabled
+    )
+    if job.action != "start":
+        return jsonify({'error': 'The container is being stopped, try again in a moment'}), 409
+    if created:
+        admission.wake()
+    return job_response(job, created, f'Exercise {exercise_id} is starting')
+
+@exercise_blueprint.route('/api/exercise/<int:exercise_id>/extend', methods=['POST'])
+def extend_exercise(exercise_id):
+    """
+    Extiende el plazo del contenedor del alumno hasta CONTAINER_TTL_SECONDS
+    desde ahora y reinicia el contador de inactividad.
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+    user_id = decoded['user_id']
+    container_name = f"user-{user_id}-exercise-{exercise_id}"
+
+    expires_at = container_reaper.extend(container_name)
+    if expires_at is None:
+        return jsonify({'error': 'Container not found'}), 404
+    return jsonify({'message': 'Deadline extended', 'expires_at': expires_at.isoformat() + 'Z'})
 
 @exercise_blueprint.route('/api/exercise/<int:exercise_id>/stop', methods=['POST'])
 def stop_exercise(exercise_id):
@@ -260,15 +372,17 @@ def stop_exercise(exercise_id):
     container_name = f"user-{user_id}-exercise-{exercise_id}"
 
     try:
-        container = client.containers.get(container_name)
-        container.stop()
-        container.remove()
-        return jsonify({'message': f'Exercise {exercise_id} stopped successfully'})
-    except docker.errors.NotFound:
+        info = container_registry.lookup(container_name)
+    except HostUnavailable as e:
+        current_app.logger.error(str(e))
+        return jsonify({'error': 'The Docker host of this container is unavailable'}), 503
+    if info is None and not container_jobs.active_job(user_id, exercise_id):
         return jsonify({'error': 'Container not found'}), 404
-    except docker.errors.APIError as e:
-        current_app.logger.error(f"Failed to stop container: {str(e)}")
-        return jsonify({'error': 'An internal error occurred while stopping the container.'}), 500
+
+    job, created = container_jobs.submit(user_id, exercise_id, "stop", stop_container_job)
+    if job.action != "stop":
+        return jsonify({'error': 'The container is still starting, try again in a moment'}), 409
+    return job_response(job, created, f'Exercise {exercise_id} is stopping')
 
 
 
@@ -402,7 +516,16 @@ def submit_group_answer(exercise_id):
         else:
             group_answer.answer_text = answer_text
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # El compañero la creó al mismo tiempo: se actualiza la suya
+            db.session.rollback()
+            GroupExerciseAnswer.query.filter_by(
+                group_id=group.id,
+                question_id=question_id
+            ).update({'answer_text': answer_text})
+            db.session.commit()
         return jsonify({'message': 'Respuesta enviada a nivel grupal'}), 200
     else:
         return jsonify({'error': 'No estás en un grupo para este ejercicio'}), 400
@@ -489,13 +612,25 @@ def add_exercise():
         return jsonify({'error': 'Permission denied'}), 403
 
     data = request.json
+    try:
+        port = int(data['port'])
+    except (TypeError, ValueError):
+        return jsonify({'error': "'port' must be an integer"}), 400
+    if not port_allocator.in_range(port):
+        return jsonify({'error': (
+            f"'port' must be between {current_app.config['PORT_RANGE_START']} "
+            f"and {current_app.config['PORT_RANGE_END'] - 1}"
+        )}), 400
+
     new_exercise = Exercise(
         title=data['title'],
         description=data['description'],
         dockerfile_path=data['dockerfile_path'],
-        port=data['port']
     )
-    db.session.add(new_exercise)
+    try:
+        port_allocator.claim(new_exercise, port)
+    except PortUnavailable as e:
+        return jsonify({'error': str(e)}), 409
     db.session.commit()
     return jsonify({'message': 'Exercise added successfully'}), 201
 
@@ -523,9 +658,6 @@ def add_exercise_with_zip():
     if not title or not description or not zipfile_obj:
         return jsonify({'error': 'Missing title, description or zipfile'}), 400
 
-    # Asignar puerto libre
-    port = get_free_port()
-
     # --- Generar slug seguro ---
     raw_slug = re.sub(r'[^A-Za-z0-9]+', '_', title.lower()).strip('_')
     slug     = secure_filename(raw_slug) or 'exercise'
@@ -563,9 +695,11 @@ def add_exercise_with_zip():
         title=title,
         description=description,
         dockerfile_path=f"dockerfiles/{slug}",
-        port=port
     )
-    db.session.add(new_exercise)
+    try:
+        port_allocator.allocate(new_exercise)
+    except PortUnavailable as e:
+        return jsonify({'error': str(e)}), 503
     db.session.commit()
 
     return jsonify({'message': 'Exercise with ZIP added successfully'}), 201
@@ -573,8 +707,9 @@ def add_exercise_with_zip():
 @exercise_blueprint.route('/api/exercise/<int:exercise_id>', methods=['DELETE'])
 def delete_exercise(exercise_id):
     """
-    Elimina el ejercicio de la BD y su carpeta, deteniendo y
-    removiendo contenedores asociados para liberar el puerto.
+    Elimina el ejercicio de la BD y su carpeta. Los contenedores asociados
+    se eliminan en segundo plano; `teardown_id` permite consultar el
+    resultado en /api/admin/teardown/<id>.
     Solo para admin.
     """
     decoded = decode_token()
@@ -589,19 +724,21 @@ def delete_exercise(exercise_id):
     if not exercise:
         return jsonify({'error': 'Exercise not found'}), 404
 
-    # Detener y eliminar contenedores asociados
-    containers = client.containers.list(all=True, filters={"name": f"exercise-{exercise_id}"})
-    for c in containers:
-        try:
-            c.stop()
-        except docker.errors.APIError:
-            pass
-        try:
-            c.remove(force=True)
-        except docker.errors.APIError:
-            pass
+    # Detener y eliminar contenedores asociados (de alumnos y del pool precalentado).
+    # El filtro de Docker es por subcadena: "exercise-1" también coincide con "exercise-12"
+    containers = placement.list_containers(all=True, filters={"name": f"exercise-{exercise_id}"})
+    own_name = re.compile(rf"(^user-\d+-exercise-{exercise_id}$)|(^{warm_container_name(exercise_id, '')}\d+$)")
+    names = [c.name for _, c in containers if own_name.match(c.name)]
+    container_reaper.release(*names)
+    batch = container_teardown.submit(names, "delete_exercise", requested_by=user.id)
 
     # Eliminar el ejercicio de la BD
+    asset_cache.invalidate_exercise(exercise_id)
+    image_build_cache.forget(exercise.dockerfile_path)
+
+    ExerciseWarmPool.query.filter_by(exercise_id=exercise_id).delete()
+    CapacityReservation.query.filter_by(exercise_id=exercise_id).delete()
+    port_allocator.release(exercise_id)
     db.session.delete(exercise)
     db.session.commit()
 
@@ -618,7 +755,211 @@ def delete_exercise(exercise_id):
         except Exception as e:
             print(f"No se pudo eliminar la carpeta: {e}")
 
-    return jsonify({'message': 'Exercise deleted successfully'}), 200
+    return jsonify({'message': 'Exercise deleted successfully', 'teardown_id': batch.id}), 200
+
+
+# -------------------------
+#   ADMIN: ELIMINACIÓN DE CONTENEDORES
+# -------------------------
+
+@exercise_blueprint.route('/api/admin/teardown/<string:batch_id>', methods=['GET'])
+def get_teardown(batch_id):
+    """
+    Resultado, contenedor por contenedor, de una eliminación en segundo plano
+    (cierre de sesión o borrado de un ejercicio).
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user = User.query.get(decoded['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    batch = TeardownBatch.query.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Teardown not found'}), 404
+    return jsonify(container_teardown.summary(batch))
+
+
+# -------------------------
+#   ADMIN: POOL PRECALENTADO
+# -------------------------
+
+@exercise_blueprint.route('/api/admin/exercise/<int:exercise_id>/warm_pool', methods=['GET'])
+def get_warm_pool(exercise_id):
+    """
+    Devuelve el tamaño configurado del pool de contenedores precalentados
+    del ejercicio y cuántos están listos para asignarse.
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user = User.query.get(decoded['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    if not Exercise.query.get(exercise_id):
+        return jsonify({'error': 'Exercise not found'}), 404
+
+    pool = ExerciseWarmPool.query.filter_by(exercise_id=exercise_id).first()
+    return jsonify({
+        'exercise_id': exercise_id,
+        'size': pool.size if pool else 0,
+        'ready': warm_pool.ready_count(exercise_id),
+    })
+
+@exercise_blueprint.route('/api/admin/exercise/<int:exercise_id>/warm_pool', methods=['PUT'])
+def scale_warm_pool(exercise_id):
+    """
+    Ajusta el tamaño del pool precalentado (por ejemplo, antes de una clase).
+    Recibe JSON { "size": N }; los contenedores se crean o eliminan en
+    segundo plano.
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user = User.query.get(decoded['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    if not Exercise.query.get(exercise_id):
+        return jsonify({'error': 'Exercise not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    size = data.get('size')
+    max_size = current_app.config['WARM_POOL_MAX_SIZE']
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0 or size > max_size:
+        return jsonify({'error': f'size must be an integer between 0 and {max_size}'}), 400
+
+    pool = ExerciseWarmPool.query.filter_by(exercise_id=exercise_id).first()
+    if pool is None:
+        pool = ExerciseWarmPool(exercise_id=exercise_id, size=size)
+        db.session.add(pool)
+    else:
+        pool.size = size
+    db.session.commit()
+
+    warm_pool.refill_async(exercise_id)
+    return jsonify({'message': 'Warm pool updated', 'exercise_id': exercise_id, 'size': size}), 202
+
+
+# -------------------------
+#   ADMIN: CAPACIDAD DEL HOST
+# -------------------------
+
+def parse_utc(value):
+    """Fecha ISO 8601 (con o sin zona; sin zona se asume UTC) a datetime UTC sin zona."""
+    parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def reservation_to_dict(reservation):
+    return {
+        'id': reservation.id,
+        'exercise_id': reservation.exercise_id,
+        'label': reservation.label,
+        'slots': reservation.slots,
+        'starts_at': reservation.starts_at.isoformat() + 'Z',
+        'ends_at': reservation.ends_at.isoformat() + 'Z',
+    }
+
+@exercise_blueprint.route('/api/admin/capacity', methods=['GET'])
+def get_capacity():
+    """
+    Capacidad del host para contenedores de laboratorio: cupos totales, en
+    uso, inicios en cola y reservas vigentes o futuras.
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user = User.query.get(decoded['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    reservations = (
+        CapacityReservation.query
+        .filter(CapacityReservation.ends_at > datetime.datetime.utcnow())
+        .order_by(CapacityReservation.starts_at)
+        .all()
+    )
+    summary = admission.summary()
+    summary['reservations'] = [reservation_to_dict(r) for r in reservations]
+    return jsonify(summary)
+
+@exercise_blueprint.route('/api/admin/capacity/reservations', methods=['POST'])
+def create_capacity_reservation():
+    """
+    Reserva cupos para un ejercicio durante una ventana (p. ej. una sección
+    agendada). Recibe JSON:
+    { "exercise_id": 1, "slots": 40, "starts_at": "...", "ends_at": "...", "label": "..." }
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user = User.query.get(decoded['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    data = request.get_json(silent=True) or {}
+    exercise_id = data.get('exercise_id')
+    slots = data.get('slots')
+    if not isinstance(exercise_id, int) or not Exercise.query.get(exercise_id):
+        return jsonify({'error': 'Exercise not found'}), 404
+    if not isinstance(slots, int) or isinstance(slots, bool) or slots < 1:
+        return jsonify({'error': 'slots must be a positive integer'}), 400
+    try:
+        starts_at = parse_utc(data.get('starts_at'))
+        ends_at = parse_utc(data.get('ends_at'))
+    except ValueError:
+        return jsonify({'error': 'starts_at and ends_at must be ISO 8601 dates'}), 400
+    if ends_at <= starts_at:
+        return jsonify({'error': 'ends_at must be after starts_at'}), 400
+
+    # Las reservas que se solapan no pueden superar la capacidad del host
+    overlapping = (
+        db.session.query(db.func.coalesce(db.func.sum(CapacityReservation.slots), 0))
+        .filter(CapacityReservation.starts_at < ends_at, CapacityReservation.ends_at > starts_at)
+        .scalar()
+    )
+    available = admission.host_slots() - overlapping
+    if slots > available:
+        return jsonify({'error': f'Only {max(0, available)} slots can be reserved in that window'}), 409
+
+    reservation = CapacityReservation(
+        exercise_id=exercise_id,
+        label=(data.get('label') or '')[:100] or None,
+        slots=slots,
+        starts_at=starts_at,
+        ends_at=ends_at,
+        created_by=user.id,
+    )
+    db.session.add(reservation)
+    db.session.commit()
+    return jsonify(reservation_to_dict(reservation)), 201
+
+@exercise_blueprint.route('/api/admin/capacity/reservations/<int:reservation_id>', methods=['DELETE'])
+def delete_capacity_reservation(reservation_id):
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user = User.query.get(decoded['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+
+    reservation = CapacityReservation.query.get(reservation_id)
+    if not reservation:
+        return jsonify({'error': 'Reservation not found'}), 404
+    db.session.delete(reservation)
+    db.session.commit()
+    admission.wake()
+    return jsonify({'message': 'Reservation deleted'})
 
 
 # -------------------------
@@ -629,6 +970,7 @@ def delete_exercise(exercise_id):
 def get_exercise_answers(exercise_id):
     """
     Devuelve en un JSON las respuestas individuales y grupales de un ejercicio.
+    Admite paginación por clave y proyección de campos (ver `parse_page_args`).
     Solo accesible para administradores.
     """
     decoded = decode_token()
@@ -639,74 +981,79 @@ def get_exercise_answers(exercise_id):
     if not admin_user or not admin_user.is_admin:
         return jsonify({'error': 'Forbidden'}), 403
 
-    # --- Respuestas INDIVIDUALES ---
-    individual_q = (
-        db.session.query(
-            ExerciseAnswer.id.label('answer_id'),
-            ExerciseAnswer.answer_text,
-            ExerciseAnswer.score,
-            ExerciseAnswer.feedback,
-            ExerciseQuestion.id.label('question_id'),
-            ExerciseQuestion.question_text,
-            User.id.label('user_id'),
-            User.email.label('user_email')
-        )
-        .join(ExerciseQuestion, ExerciseQuestion.id == ExerciseAnswer.question_id)
-        .join(User, User.id == ExerciseAnswer.user_id)
-        .filter(ExerciseQuestion.exercise_id == exercise_id)
-    )
+    try:
+        page = parse_page_args(request.args)
+    except PageArgsError as e:
+        return jsonify({'error': str(e)}), 400
 
-    individual_answers = [{
-        'answer_id': row.answer_id,
-        'question_id': row.question_id,
-        'question_text': row.question_text,
-        'user': {
-            'id': row.user_id,
-            'email': row.user_email
-        },
-        'answer_text': row.answer_text,
-        'score': row.score,
-        'feedback': row.feedback
-    } for row in individual_q.all()]
-
-    # --- Respuestas GRUPALES ---
-    group_q = (
-        db.session.query(
-            GroupExerciseAnswer.id.label('answer_id'),
-            GroupExerciseAnswer.answer_text,
-            GroupExerciseAnswer.score,
-            ExerciseQuestion.id.label('question_id'),
-            ExerciseQuestion.question_text,
-            ExerciseGroup.id.label('group_id'),
-            ExerciseGroup.leader_id,
-            ExerciseGroup.partner_id
-        )
-        .join(ExerciseQuestion, ExerciseQuestion.id == GroupExerciseAnswer.question_id)
-        .join(ExerciseGroup, ExerciseGroup.id == GroupExerciseAnswer.group_id)
-        .filter(ExerciseQuestion.exercise_id == exercise_id)
-    )
+    # --- Respuestas INDIVIDUALES (solo de usuarios que aún existen) ---
+    individual_q = individual_answers_query(exercise_id).filter(User.id.isnot(None))
+
+    def individual_item(row):
+        return {
+            'answer_id': row.answer_id,
+            'question_id': row.question_id,
+            'question_text': row.question_text,
+            'user': {
+                'id': row.user_id,
+                'email': row.user_email
+            },
+            'answer_text': row.answer_text,
+            'score': row.score,
+            'feedback': row.feedback
+        }
 
-    group_answers = []
-    for row in group_q.all():
-        leader = User.query.get(row.leader_id)
-        partner = User.query.get(row.partner_id) if row.partner_id else None
-        group_answers.append({
+    # --- Respuestas GRUPALES (líder y compañero en el mismo JOIN) ---
+    def group_item(row):
+        return {
             'answer_id': row.answer_id,
             'question_id': row.question_id,
             'question_text': row.question_text,
             'group': {
                 'id': row.group_id,
-                'leader_email': leader.email if leader else None,
-                'partner_email': partner.email if partner else None
+                'leader_email': row.leader_email,
+                'partner_email': row.partner_email
             },
             'answer_text': row.answer_text,
             'score': row.score
-        })
+        }
 
-    return jsonify({
-        'individual_answers': individual_answers,
-        'group_answers': group_answers
-    }), 200
+    return jsonify(answers_listing(
+        individual_q, group_answers_query(exercise_id), page, individual_item, group_item
+    )), 200
+
+@exercise_blueprint.route('/api/admin/answers/export', methods=['GET'])
+def export_answers():
+    """
+    Exporta las respuestas individuales y grupales (con puntaje y feedback)
+    como CSV o NDJSON, enviadas por bloques mientras se leen de la base de
+    datos. Filtros opcionales: `exercise_id`, `question_id`, `graded`.
+    Solo accesible para administradores.
+    """
+    decoded = decode_token()
+    if not decoded:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    admin_user = User.query.get(decoded['user_id'])
+    if not admin_user or not admin_user.is_admin:
+        return jsonify({'error': 'Forbidden'}), 403
+
+    try:
+        fmt, filters = parse_export_args(request.args)
+    except PageArgsError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = export_rows(**filters)
+    if fmt == 'csv':
+        body, mimetype = stream_csv(rows), 'text/csv'
+    else:
+        body, mimetype = stream_ndjson(rows), 'application/x-ndjson'
+    suffix = f"exercise-{filters['exercise_id']}" if filters['exercise_id'] is not None else "all"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="answers-{suffix}.{fmt}"'},
+    )
 
 @exercise_blueprint.route('/api/admin/answer/<string:mode>/<int:answer_id>', methods=['PATCH'])
 def grade_answer(mode, answer_id):
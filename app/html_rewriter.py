@@ -0,0 +1,156 @@
+import hashlib
+import threading
+
+import bleach
+from bleach import html5lib_shim
+from bleach.sanitizer import BleachSanitizerFilter
+
+from .cache import BoundedLRU
+
+ALLOWED_TAGS = bleach.sanitizer.ALLOWED_TAGS | {"form", "input", "button"}
+ALLOWED_ATTRS = {
+    **bleach.sanitizer.ALLOWED_ATTRIBUTES,
+    "form": ["action", "method"],
+    "input": ["type", "name", "value"],
+    "button": ["type", "name"],
+}
+ALLOWED_PROTOCOLS = ["http", "https"]
+
+# Atributo con URL que se reescribe en cada etiqueta
+URL_ATTRS = {"a": "href", "link": "href", "script": "src", "img": "src"}
+
+# Tamaño aproximado de cada bloque emitido por `rewrite_html`
+OUTPUT_CHUNK_SIZE = 16 * 1024
+
+
+class ProxyUrlFilter(html5lib_shim.Filter):
+    """
+    Filtro html5lib que reescribe las URLs hacia el prefijo del proxy:
+    `href`/`src` absolutos (`/x`) o relativos (`./x`) y el `action` de
+    todos los formularios.
+    """
+
+    def __init__(self, source, proxy_prefix, form_action):
+        super().__init__(source)
+        self.proxy_prefix = proxy_prefix
+        self.form_action = form_action
+
+    def __iter__(self):
+        for token in super().__iter__():
+            if token["type"] in ("StartTag", "EmptyTag"):
+                name = token["name"]
+                if name == "form":
+                    token["data"][(None, "action")] = self.form_action
+                elif name in URL_ATTRS:
+                    key = (None, URL_ATTRS[name])
+                    url = token["data"].get(key)
+                    if url is not None:
+                        if url.startswith("/"):
+                            token["data"][key] = self.proxy_prefix + url.lstrip("/")
+                        elif url.startswith("./"):
+                            token["data"][key] = self.proxy_prefix + url[2:]
+            yield token
+
+
+class HtmlRewriter(bleach.Cleaner):
+    """
+    Reescritura de URLs y saneamiento con lista blanca en una sola pasada:
+    el documento se parsea una vez y el mismo recorrido de tokens pasa por el
+    sanitizador de bleach, por `ProxyUrlFilter` y por el serializador.
+
+    La política (etiquetas, atributos y protocolos permitidos) se compila una
+    sola vez. Como el parser de html5lib guarda estado, se usa una instancia
+    por hilo (ver `rewrite_html`).
+    """
+
+    def __init__(self):
+        super().__init__(
+            tags=ALLOWED_TAGS,
+            attributes=ALLOWED_ATTRS,
+            protocols=ALLOWED_PROTOCOLS,
+            strip=True,
+        )
+
+    def rewrite(self, text, proxy_prefix, form_action):
+        """
+        Retorna un generador con el HTML saneado y reescrito, por bloques.
+        """
+        if not text:
+            return
+        dom = self.parser.parseFragment(text)
+        filtered = BleachSanitizerFilter(
+            source=self.walker(dom),
+            allowed_tags=self.tags,
+            attributes=self.attributes,
+            strip_disallowed_tags=self.strip,
+            strip_html_comments=self.strip_comments,
+            css_sanitizer=self.css_sanitizer,
+            allowed_protocols=self.protocols,
+        )
+        filtered = ProxyUrlFilter(filtered, proxy_prefix, form_action)
+
+        buffer = []
+        size = 0
+        for piece in self.serializer.serialize(filtered):
+            buffer.append(piece)
+            size += len(piece)
+            if size >= OUTPUT_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+
+
+_local = threading.local()
+
+
+def get_rewriter():
+    rewriter = getattr(_local, "rewriter", None)
+    if rewriter is None:
+        rewriter = _local.rewriter = HtmlRewriter()
+    return rewriter
+
+
+def rewrite_html(text, proxy_prefix, form_action):
+    """
+    Sanea `text` y reescribe sus URLs hacia `proxy_prefix`, usando el
+    `HtmlRewriter` del hilo actual. Retorna un generador de bloques de texto.
+    """
+    return get_rewriter().rewrite(text, proxy_prefix, form_action)
+
+
+# Salida ya reescrita y saneada, direccionada por el contenido original
+rewrite_cache = BoundedLRU()
+
+
+def rewrite_cache_key(exercise_id, path, encoding, body):
+    """
+    Clave de caché para el HTML de un ejercicio. Todos los alumnos del mismo
+    ejercicio usan la misma imagen, así que la misma ruta con el mismo cuerpo
+    produce exactamente la misma salida.
+    """
+    digest = hashlib.blake2b(body, digest_size=16).digest()
+    return (exercise_id, path, encoding, digest)
+
+
+def encode_and_cache(key, chunks):
+    """
+    Codifica en UTF-8 los bloques de `rewrite_html` a medida que se emiten
+    y, al terminar, guarda el resultado completo en `rewrite_cache`.
+    """
+    parts = []
+    size = 0
+    cacheable = True
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        if cacheable:
+            size += len(data)
+            if size > rewrite_cache.max_item_bytes:
+                cacheable = False
+                parts = []
+            else:
+                parts.append(data)
+        yield data
+    if cacheable:
+        rewrite_cache.put(key, b"".join(parts), size)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import stat
+
+import docker
+from docker.utils.build import exclude_paths
+
+from .locks import named_locks
+
+# Etiqueta de la imagen con el hash del contexto con que se construyó
+CONTEXT_HASH_LABEL = "labcentral.context-hash"
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def read_dockerignore(build_path):
+    """Patrones de `.dockerignore`, leídos igual que en `docker-py`."""
+    dockerignore = os.path.join(build_path, ".dockerignore")
+    if not os.path.exists(dockerignore):
+        return []
+    with open(dockerignore) as f:
+        return [line.strip() for line in f.read().splitlines() if line.strip() and not line.strip().startswith("#")]
+
+
+class ImageBuildCache:
+    """
+    Evita reconstruir la imagen `exercise-{id}` en cada inicio de ejercicio.
+
+    La imagen se etiqueta con un hash del contexto de construcción (rutas,
+    permisos y contenido de los archivos que Docker enviaría, respetando
+    `.dockerignore`). Si la imagen existente tiene el mismo hash se reutiliza
+    sin enviar el contexto al daemon; solo se reconstruye si algo cambió.
+
+    Un lock por daemon y tag (ver `named_locks`, vale entre workers) hace
+    que los alumnos que inician el mismo ejercicio a la vez esperen a una
+    sola construcción en lugar de lanzar una cada uno.
+    El hash se memoriza por (ruta, tamaño, mtime) de cada archivo, así que
+    solo se vuelven a leer los archivos modificados.
+    """
+
+    def __init__(self):
+        self._hashes = {}  # build_path -> (firma de stat, hash)
+
+    def context_hash(self, build_path):
+        root = os.path.abspath(build_path)
+        files = sorted(exclude_paths(root, read_dockerignore(root)))
+        entries = []
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            entries.append((name, st.st_mode, st.st_size, st.st_mtime_ns))
+        signature = tuple(entries)
+
+        cached = self._hashes.get(root)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        for name, mode, _, _ in entries:
+            path = os.path.join(root, name)
+            digest.update(name.encode("utf-8", "surrogateescape") + b"\0")
+            digest.update(oct(mode).encode() + b"\0")
+            if stat.S_ISLNK(mode):
+                digest.update(os.readlink(path).encode("utf-8", "surrogateescape"))
+            elif stat.S_ISREG(mode):
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                        digest.update(block)
+            digest.update(b"\0")
+        value = digest.hexdigest()
+        self._hashes[root] = (signature, value)
+        return value
+
+    def ensure_image(self, client, tag, build_path):
+        """
+        Retorna (imagen, reconstruida). Construye la imagen `tag` solo si no
+        existe o si el contexto en `build_path` cambió desde la última vez.
+        Cada daemon tiene sus propias imágenes (ver `placement`).
+        """
+        with named_locks.hold(f"image-{client.api.base_url}-{tag}"):
+            context_hash = self.context_hash(build_path)
+            try:
+                image = client.images.get(tag)
+                if (image.labels or {}).get(CONTEXT_HASH_LABEL) == context_hash:
+                    return image, False
+            except docker.errors.ImageNotFound:
+                pass
+            image, _ = client.images.build(
+                path=build_path,
+                tag=tag,
+                labels={CONTEXT_HASH_LABEL: context_hash},
+            )
+            return image, True
+
+    def forget(self, build_path):
+        self._hashes.pop(os.path.abspath(build_path), None)
+
+
+image_build_cache = ImageBuildCache()
@@ -0,0 +1,213 @@
+import datetime
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import ContainerJob, db
+
+ACTIVE_STATES = ("queued", "building", "starting", "stopping")
+TERMINAL_STATES = ("ready", "stopped", "failed")
+
+# Un inicio en la cola de admisión sin latido por este tiempo quedó huérfano
+# (el worker que lo encoló se reinició)
+QUEUED_JOB_HEARTBEAT_TIMEOUT = 30
+
+
+class ContainerJobFailed(Exception):
+    """Falla conocida de un trabajo; su mensaje se informa en `job.error`."""
+
+
+@dataclass
+class JobContext:
+    id: str
+    user_id: int
+    exercise_id: int
+    action: str
+
+
+class ContainerJobs:
+    """
+    Ejecuta el inicio y la detención de contenedores fuera de la petición HTTP.
+
+    Los trabajos se guardan en `ContainerJob` y corren en un pool de hilos
+    acotado (`CONTAINER_JOB_WORKERS`); además, cada daemon de Docker atiende
+    como máximo `CONTAINER_JOBS_PER_DAEMON` trabajos a la vez, para que una
+    ráfaga de inicios no sature el daemon con construcciones simultáneas.
+
+    Mientras un trabajo está activo su `active_key` (único) identifica al
+    par alumno-ejercicio, de modo que un segundo clic, incluso desde otro
+    worker, se une al trabajo existente en vez de crear otro. Un trabajo que
+    no avanza en `CONTAINER_JOB_TIMEOUT` segundos (p. ej. porque el worker se
+    reinició) se da por fallido.
+
+    Los inicios encolados con `deferred=True` no pasan al pool hasta que el
+    control de admisión (`admission`) los despacha con `dispatch`.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+        self._slots = {}
+        self._guard = threading.Lock()
+        self._deferred = {}  # id -> (JobContext, handler) esperando admisión
+
+    def init_app(self, app):
+        app.config.setdefault("CONTAINER_JOB_WORKERS", int(os.getenv("CONTAINER_JOB_WORKERS", "8")))
+        app.config.setdefault("CONTAINER_JOBS_PER_DAEMON", int(os.getenv("CONTAINER_JOBS_PER_DAEMON", "4")))
+        app.config.setdefault("CONTAINER_JOB_TIMEOUT", int(os.getenv("CONTAINER_JOB_TIMEOUT", "900")))
+        app.config.setdefault("CONTAINER_READY_TIMEOUT", int(os.getenv("CONTAINER_READY_TIMEOUT", "30")))
+        self.app = app
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config["CONTAINER_JOB_WORKERS"],
+            thread_name_prefix="container-job",
+        )
+        app.extensions["container_jobs"] = self
+
+    def daemon_slot(self, client):
+        """
+        Semáforo que limita los trabajos simultáneos sobre un daemon; los
+        handlers lo toman una vez que saben en qué host trabajan.
+        """
+        key = client.api.base_url
+        with self._guard:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.app.config["CONTAINER_JOBS_PER_DAEMON"])
+            return slot
+
+    # -------------------------
+    #   CONSULTAS
+    # -------------------------
+
+    @staticmethod
+    def active_key(user_id, exercise_id):
+        return f"{user_id}-{exercise_id}"
+
+    def active_job(self, user_id, exercise_id):
+        """Retorna el trabajo activo del alumno en el ejercicio, si lo hay."""
+        job = ContainerJob.query.filter_by(active_key=self.active_key(user_id, exercise_id)).first()
+        if job is None:
+            return None
+        if job.admitted_at is None:
+            timeout = datetime.timedelta(seconds=QUEUED_JOB_HEARTBEAT_TIMEOUT)
+        else:
+            timeout = datetime.timedelta(seconds=self.app.config["CONTAINER_JOB_TIMEOUT"])
+        if job.updated_at < datetime.datetime.utcnow() - timeout:
+            self._finish(job, "failed", "Job timed out")
+            db.session.commit()
+            return None
+        return job
+
+    @staticmethod
+    def latest_job(user_id, exercise_id):
+        return (
+            ContainerJob.query
+            .filter_by(user_id=user_id, exercise_id=exercise_id)
+            .order_by(ContainerJob.created_at.desc())
+            .first()
+        )
+
+    # -------------------------
+    #   ENCOLADO
+    # -------------------------
+
+    def submit(self, user_id, exercise_id, action, handler, deferred=False):
+        """
+        Encola `handler(job, progress)` para el alumno y el ejercicio.
+        Retorna (trabajo, creado): si ya hay un trabajo activo se retorna ese
+        con `creado=False`; la acción del trabajo existente puede ser otra.
+        Con `deferred=True` el trabajo espera a que se llame a `dispatch`.
+        """
+        existing = self.active_job(user_id, exercise_id)
+        if existing is not None:
+            return existing, False
+
+        job = ContainerJob(
+            id=secrets.token_hex(16),
+            user_id=user_id,
+            exercise_id=exercise_id,
+            action=action,
+            state="queued",
+            active_key=self.active_key(user_id, exercise_id),
+            admitted_at=None if deferred else datetime.datetime.utcnow(),
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Otra petición creó el trabajo entre la consulta y el insert
+            db.session.rollback()
+            existing = self.active_job(user_id, exercise_id)
+            if existing is None:
+                raise
+            return existing, False
+
+        context = JobContext(job.id, user_id, exercise_id, action)
+        if deferred:
+            with self._guard:
+                self._deferred[job.id] = (context, handler)
+        else:
+            self._executor.submit(self._run, context, handler)
+        return job, True
+
+    def deferred_ids(self):
+        """Trabajos de este worker que esperan admisión."""
+        with self._guard:
+            return list(self._deferred)
+
+    def dispatch(self, job_id):
+        """Pasa al pool un trabajo diferido (ya admitido)."""
+        with self._guard:
+            entry = self._deferred.pop(job_id, None)
+        if entry is not None:
+            self._executor.submit(self._run, *entry)
+
+    def discard(self, job_id):
+        """Olvida un trabajo diferido que ya no está en la cola."""
+        with self._guard:
+            self._deferred.pop(job_id, None)
+
+    # -------------------------
+    #   EJECUCIÓN
+    # -------------------------
+
+    def _run(self, context, handler):
+        with self.app.app_context():
+            try:
+                final_state = handler(context, lambda state: self.set_state(context.id, state))
+                self.set_state(context.id, final_state or "ready")
+            except ContainerJobFailed as e:
+                db.session.rollback()
+                self.app.logger.warning(f"Container {context.action} job {context.id} failed: {str(e)}")
+                self.set_state(context.id, "failed", str(e))
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Container {context.action} job {context.id} failed: {str(e)}")
+                self.set_state(context.id, "failed", "An internal error occurred while handling the container.")
+            finally:
+                db.session.remove()
+
+    def set_state(self, job_id, state, error=None):
+        job = ContainerJob.query.get(job_id)
+        if job is None:
+            return
+        if state in TERMINAL_STATES:
+            self._finish(job, state, error)
+        else:
+            job.state = state
+            job.updated_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+    @staticmethod
+    def _finish(job, state, error=None):
+        job.state = state
+        job.error = error
+        job.active_key = None
+        job.updated_at = datetime.datetime.utcnow()
+
+
+container_jobs = ContainerJobs()
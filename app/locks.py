@@ -0,0 +1,64 @@
+import fcntl
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+
+class NamedLocks:
+    """
+    Locks exclusivos por nombre que valen entre todos los workers de
+    gunicorn de la máquina.
+
+    Cada nombre corresponde a un archivo en `LOCK_DIR` sobre el que se toma
+    un `flock`; el sistema operativo lo suelta si el worker muere. Dentro
+    de un mismo proceso los hilos se ordenan primero con un lock en memoria,
+    así el archivo solo se abre una vez por proceso y nombre a la vez.
+
+    Sirve para que dos operaciones sobre lo mismo (iniciar el contenedor de
+    un alumno, construir una imagen) no corran en paralelo: la segunda
+    espera a la primera y luego, al volver a mirar el estado, reutiliza su
+    resultado.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "LOCK_DIR",
+            os.getenv("LOCK_DIR", os.path.join(app.instance_path, "locks")),
+        )
+        os.makedirs(app.config["LOCK_DIR"], exist_ok=True)
+        self.app = app
+        app.extensions["named_locks"] = self
+
+    def _path(self, name):
+        # Nombre legible más un hash corto para que dos nombres no compartan archivo
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", name)[:80]
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.app.config["LOCK_DIR"], f"{safe}-{digest}.lock")
+
+    def _thread_lock(self, name):
+        with self._guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def hold(self, name):
+        """Bloquea hasta obtener el lock `name` (en todos los workers)."""
+        with self._thread_lock(name):
+            with open(self._path(name), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+named_locks = NamedLocks()
@@ -0,0 +1,235 @@
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .asset_cache import asset_cache
+from .exercise import decode_token
+from .html_rewriter import rewrite_cache
+from .models import User
+from .upstream import upstream_pool
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+registry = CollectorRegistry()
+
+# Con varios workers cada proceso escribe sus contadores en este directorio
+# (ver `gunicorn.conf.py`) y `/metrics` los suma; sin él, son por proceso
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+proxy_stage_seconds = Histogram(
+    "labcentral_proxy_stage_seconds",
+    "Tiempo de cada etapa de una petición al proxy de ejercicios.",
+    ["exercise", "stage"],
+    buckets=STAGE_BUCKETS,
+    registry=registry,
+)
+proxy_request_seconds = Histogram(
+    "labcentral_proxy_request_seconds",
+    "Tiempo total de una petición al proxy, hasta enviar el último byte.",
+    ["exercise"],
+    buckets=STAGE_BUCKETS,
+    registry=registry,
+)
+proxy_requests_total = Counter(
+    "labcentral_proxy_requests",
+    "Peticiones atendidas por el proxy de ejercicios.",
+    ["exercise", "method", "status"],
+    registry=registry,
+)
+proxy_request_bytes_total = Counter(
+    "labcentral_proxy_request_bytes",
+    "Bytes de cuerpo enviados por los clientes hacia los contenedores.",
+    ["exercise"],
+    registry=registry,
+)
+proxy_response_bytes_total = Counter(
+    "labcentral_proxy_response_bytes",
+    "Bytes de cuerpo enviados a los clientes (tras la compresión).",
+    ["exercise"],
+    registry=registry,
+)
+
+
+class CacheCollector:
+    """
+    Expone las estadísticas de las cachés en memoria en cada lectura. Son
+    del proceso que atiende el scrape: en modo multiproceso llevan la
+    etiqueta `pid` para no confundirlas con las de otro worker.
+    """
+
+    def collect(self):
+        caches = {"html_rewrite": rewrite_cache, "asset": asset_cache.store}
+        labels = ["cache", "pid"] if MULTIPROCESS else ["cache"]
+        extra = [str(os.getpid())] if MULTIPROCESS else []
+        entries = GaugeMetricFamily("labcentral_cache_entries", "Entradas guardadas en la caché.", labels=labels)
+        size = GaugeMetricFamily("labcentral_cache_bytes", "Bytes ocupados por la caché.", labels=labels)
+        max_size = GaugeMetricFamily("labcentral_cache_max_bytes", "Capacidad máxima de la caché.", labels=labels)
+        hits = CounterMetricFamily("labcentral_cache_hits", "Aciertos de la caché.", labels=labels)
+        misses = CounterMetricFamily("labcentral_cache_misses", "Fallos de la caché.", labels=labels)
+        evictions = CounterMetricFamily("labcentral_cache_evictions", "Entradas descartadas por falta de espacio.", labels=labels)
+        for name, cache in caches.items():
+            stats = cache.stats()
+            entries.add_metric([name] + extra, stats["entries"])
+            size.add_metric([name] + extra, stats["bytes"])
+            max_size.add_metric([name] + extra, stats["max_bytes"])
+            hits.add_metric([name] + extra, stats["hits"])
+            misses.add_metric([name] + extra, stats["misses"])
+            evictions.add_metric([name] + extra, stats["evictions"])
+        yield from (entries, size, max_size, hits, misses, evictions)
+
+        hosts = GaugeMetricFamily(
+            "labcentral_upstream_pool_hosts", "Contenedores con conexiones keep-alive abiertas.",
+            labels=["pid"] if MULTIPROCESS else None,
+        )
+        hosts.add_metric(extra, len(upstream_pool))
+        yield hosts
+
+
+registry.register(CacheCollector())
+
+
+class ProxyTimer:
+    """
+    Mide las etapas de una petición al proxy y registra las métricas al
+    terminar de enviar la respuesta.
+
+    La etiqueta `exercise` se fija solo cuando existe el contenedor del
+    alumno, para que ids inventados en la URL no creen series nuevas; el
+    resto de las peticiones se agrupa como "none".
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.exercise = "none"
+        self.status = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timed_iter(self, name, iterable):
+        """Suma a la etapa `name` el tiempo que tarda en producirse cada bloque."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield chunk
+
+    def attach(self, response):
+        """
+        Envuelve el cuerpo de una respuesta de Flask para contar sus bytes y
+        registrar las métricas cuando el servidor termina de enviarla.
+        """
+        self.status = response.status_code
+        response.response = MeteredBody(response.response, self)
+        return response
+
+    def wrap_send(self, send):
+        """Versión ASGI de `attach`: envuelve el `send` del servidor."""
+        async def metered_send(message):
+            if message["type"] == "http.response.start":
+                self.status = message["status"]
+            elif message["type"] == "http.response.body":
+                self.response_bytes += len(message.get("body", b""))
+            await send(message)
+        return metered_send
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        exercise = self.exercise
+        for name, seconds in self.stages.items():
+            proxy_stage_seconds.labels(exercise, name).observe(seconds)
+        proxy_request_seconds.labels(exercise).observe(time.perf_counter() - self.started)
+        proxy_requests_total.labels(exercise, self.method, str(self.status or 0)).inc()
+        if self.request_bytes:
+            proxy_request_bytes_total.labels(exercise).inc(self.request_bytes)
+        if self.response_bytes:
+            proxy_response_bytes_total.labels(exercise).inc(self.response_bytes)
+
+
+class MeteredBody:
+    """
+    Iterable que cuenta los bytes del cuerpo y cierra el `ProxyTimer` en
+    `close()`, que el servidor WSGI llama incluso si el cuerpo no se envía
+    (HEAD, 304) o el cliente se desconecta.
+    """
+
+    def __init__(self, body, timer):
+        self.body = body
+        self.timer = timer
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.timer.response_bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.timer.finish()
+
+
+@metrics_blueprint.record_once
+def configure_metrics(state):
+    state.app.config.setdefault("METRICS_TOKEN", os.getenv("METRICS_TOKEN", ""))
+
+
+def scrape_registry():
+    """Registro a exponer: en modo multiproceso, la suma de todos los workers."""
+    if not MULTIPROCESS:
+        return registry
+    combined = CollectorRegistry()
+    multiprocess.MultiProcessCollector(combined)
+    combined.register(CacheCollector())
+    return combined
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Métricas en formato Prometheus. Con `METRICS_TOKEN` se exige
+    `Authorization: Bearer <token>`; sin él, una sesión de administrador.
+    """
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        provided = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(provided, token):
+            return jsonify({"error": "Unauthorized"}), 401
+    else:
+        decoded = decode_token()
+        if not decoded:
+            return jsonify({"error": "Unauthorized"}), 401
+        user = User.query.get(decoded['user_id'])
+        if not user or not user.is_admin:
+            return jsonify({"error": "Permission denied"}), 403
+    return Response(generate_latest(scrape_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -1,3 +1,4 @@
+import datetime
 from flask_sqlalchemy import SQLAlchemy
 from . import db
 from flask_bcrypt import generate_password_hash, check_password_hash
@@ -28,6 +29,10 @@ class CompletedExercise(db.Model):
     exercise_id = db.Column(db.Integer, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_completed_exercise_user_exercise', 'user_id', 'exercise_id'),
+    )
+
 class Exercise(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -38,7 +43,7 @@ class Exercise(db.Model):
 class ExerciseQuestion(db.Model):
     __tablename__ = 'exercise_question'
     id = db.Column(db.Integer, primary_key=True)
-    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False, index=True)
     question_text = db.Column(db.String(255), nullable=False)
     question_body = db.Column(db.Text, nullable=True)
     question_type = db.Column(db.String(50), default='abierta')
@@ -54,6 +59,12 @@ class ExerciseAnswer(db.Model):
     score = db.Column(db.Float, nullable=True)
     feedback = db.Column(db.Text, nullable=True)
 
+    __table_args__ = (
+        # Una respuesta por alumno y pregunta; también sirve para buscarla
+        db.Index('uq_exercise_answer_user_question', 'user_id', 'question_id', unique=True),
+        db.Index('ix_exercise_answer_question', 'question_id'),
+    )
+
 class ExerciseGroup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
@@ -65,6 +76,12 @@ class ExerciseGroup(db.Model):
     leader = db.relationship('User', foreign_keys=[leader_id])
     partner = db.relationship('User', foreign_keys=[partner_id])
 
+    # Para `exercise_id = ? AND (leader_id = ? OR partner_id = ?)`
+    __table_args__ = (
+        db.Index('ix_exercise_group_exercise_leader', 'exercise_id', 'leader_id'),
+        db.Index('ix_exercise_group_exercise_partner', 'exercise_id', 'partner_id'),
+    )
+
 
 class GroupExerciseAnswer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -72,3 +89,82 @@ class GroupExerciseAnswer(db.Model):
     question_id = db.Column(db.Integer, db.ForeignKey('exercise_question.id'), nullable=False)
     answer_text = db.Column(db.Text, nullable=False)
     score = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        db.Index('uq_group_exercise_answer_group_question', 'group_id', 'question_id', unique=True),
+        db.Index('ix_group_exercise_answer_question', 'question_id'),
+    )
+
+
+class ExerciseWarmPool(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), unique=True, nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ContainerJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    exercise_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # start | stop
+    state = db.Column(db.String(20), nullable=False, default='queued')
+    error = db.Column(db.Text, nullable=True)
+    # "user-exercise" mientras el trabajo está activo; NULL al terminar
+    active_key = db.Column(db.String(64), unique=True, nullable=True)
+    # NULL mientras un inicio espera capacidad en la cola de admisión
+    admitted_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class CapacityReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    label = db.Column(db.String(100), nullable=True)
+    slots = db.Column(db.Integer, nullable=False)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    ends_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class ContainerPlacement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    container_name = db.Column(db.String(100), unique=True, nullable=False)
+    host = db.Column(db.String(100), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class ContainerLease(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    container_name = db.Column(db.String(100), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    exercise_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    # Última petición al proxy (la actualiza `activity_tracker` cada pocos segundos)
+    last_activity = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class TeardownBatch(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    reason = db.Column(db.String(50), nullable=False)  # logout | delete_exercise
+    requested_by = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    items = db.relationship('TeardownItem', backref='batch', lazy=True, cascade="all, delete-orphan")
+
+
+class TeardownItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(32), db.ForeignKey('teardown_batch.id'), nullable=False, index=True)
+    container_name = db.Column(db.String(100), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='pending')  # pending | removed | failed
+    error = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class PortReservation(db.Model):
+    port = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    exercise = db.relationship('Exercise')
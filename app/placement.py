@@ -0,0 +1,352 @@
+import datetime
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any
+
+import docker
+import requests
+from sqlalchemy.exc import IntegrityError
+
+from .models import ContainerPlacement, db
+
+# Recursos que reserva cada contenedor de laboratorio (ver `admission`)
+LAB_CONTAINER_MEMORY_MB = 512
+LAB_CONTAINER_CPUS = 0.5
+
+# Opciones comunes a todos los contenedores de laboratorio
+LAB_CONTAINER_OPTIONS = {
+    "network": "lab_app_net",
+    "mem_limit": f"{LAB_CONTAINER_MEMORY_MB}m",           # Máximo 512 MB de RAM
+    "nano_cpus": int(LAB_CONTAINER_CPUS * 1_000_000_000),  # ~0.5 CPU
+}
+
+# Prefijos de los contenedores que crea LabCentral (alumnos y pool precalentado)
+MANAGED_PREFIXES = ("user-", "warm-exercise-")
+
+# Errores de un daemon caído o que no responde (NotFound se trata aparte)
+HOST_ERRORS = (docker.errors.DockerException, requests.exceptions.RequestException)
+
+
+class HostUnavailable(Exception):
+    """El host donde está registrado el contenedor no responde."""
+
+
+@dataclass
+class DockerHost:
+    name: str
+    client: Any
+    memory_mb: int = 0
+    cpus: float = 0
+    unavailable_until: float = 0  # time.monotonic() hasta el que no se le consulta
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.unavailable_until
+
+    @property
+    def slots(self):
+        """Contenedores de laboratorio que caben en este host."""
+        return min(int(self.memory_mb // LAB_CONTAINER_MEMORY_MB), int(self.cpus // LAB_CONTAINER_CPUS))
+
+
+def parse_docker_hosts(value):
+    """
+    Interpreta `DOCKER_HOSTS`: lista separada por comas de `nombre=url` o
+    solo `url` (el nombre es entonces el host de la URL).
+    """
+    hosts = []
+    for entry in (value or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" in entry:
+            name, url = entry.split("=", 1)
+        else:
+            url = entry
+            name = url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0] or url
+        hosts.append((name.strip(), url.strip()))
+    return hosts
+
+
+class HostPlacement:
+    """
+    Reparte los contenedores de laboratorio entre varios daemons de Docker.
+
+    Los daemons se configuran en `DOCKER_HOSTS` (sin configurar se usa solo
+    el daemon local, como antes). Cada contenedor nuevo va al host con menos
+    memoria reservada en proporción a su presupuesto (`HOST_MEMORY_BUDGET_MB`
+    y `HOST_CPU_BUDGET`, por host) y, a igualdad, al que tiene menos
+    contenedores. El host de cada contenedor se guarda en
+    `ContainerPlacement`, de modo que el proxy, el estado y la eliminación
+    saben a qué daemon preguntar; los contenedores sin registro (p. ej.
+    anteriores a esta tabla) se buscan en todos los hosts.
+
+    Un daemon que no responde no detiene al resto: se registra el error, se
+    lo omite durante `DOCKER_HOST_RETRY_SECONDS` y mientras tanto no tiene
+    cupos, así que los contenedores nuevos van a los hosts sanos.
+
+    Para pruebas se pueden pasar los clientes ya creados (`clients`), por
+    ejemplo varios daemons locales o clientes falsos.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._hosts = {}
+        self._host_by_name = {}  # contenedor -> host (caché de ContainerPlacement)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, clients=None):
+        app.config.setdefault("DOCKER_HOSTS", os.getenv("DOCKER_HOSTS", ""))
+        # 0 = calcularlo desde cada daemon (90% de la RAM y 4 CPU de límite por núcleo)
+        app.config.setdefault("HOST_MEMORY_BUDGET_MB", int(os.getenv("HOST_MEMORY_BUDGET_MB", "0")))
+        app.config.setdefault("HOST_CPU_BUDGET", float(os.getenv("HOST_CPU_BUDGET", "0")))
+        app.config.setdefault("DOCKER_HOST_RETRY_SECONDS", int(os.getenv("DOCKER_HOST_RETRY_SECONDS", "30")))
+        self.app = app
+
+        unreachable = {}
+        if clients is None:
+            configured = parse_docker_hosts(app.config["DOCKER_HOSTS"])
+            if configured:
+                clients = {}
+                for name, url in configured:
+                    try:
+                        clients[name] = docker.DockerClient(base_url=url)
+                    except HOST_ERRORS as e:
+                        # Sin `version` el cliente consulta al daemon al crearse; con la
+                        # versión por defecto no lo hace, y el host se reintenta más tarde
+                        clients[name] = docker.DockerClient(
+                            base_url=url, version=docker.constants.DEFAULT_DOCKER_API_VERSION
+                        )
+                        unreachable[name] = e
+            else:
+                clients = {"local": docker.from_env()}
+        self._hosts = {name: DockerHost(name, client) for name, client in clients.items()}
+        for name, error in unreachable.items():
+            self.mark_unavailable(self._hosts[name], error)
+        app.extensions["placement"] = self
+
+    # -------------------------
+    #   HOSTS
+    # -------------------------
+
+    def hosts(self):
+        return list(self._hosts.values())
+
+    def host(self, name):
+        return self._hosts.get(name)
+
+    @property
+    def default_host(self):
+        return next(iter(self._hosts.values()))
+
+    def mark_unavailable(self, host, error):
+        """Registra la falla de `host` y lo omite hasta el próximo reintento."""
+        if host.available:
+            self.app.logger.error(f"Docker host {host.name} is unavailable: {str(error)}")
+        host.unavailable_until = time.monotonic() + self.app.config["DOCKER_HOST_RETRY_SECONDS"]
+
+    def _resolve_budgets(self, host):
+        if host.memory_mb and host.cpus:
+            return
+        memory_mb = self.app.config["HOST_MEMORY_BUDGET_MB"]
+        cpus = self.app.config["HOST_CPU_BUDGET"]
+        if not memory_mb or not cpus:
+            info = host.client.info()
+            memory_mb = memory_mb or int(info["MemTotal"] / (1024 * 1024) * 0.9)
+            cpus = cpus or info["NCPU"] * 4
+        host.memory_mb, host.cpus = memory_mb, cpus
+
+    def host_slots(self, host):
+        """Cupos de `host`; 0 mientras no responde."""
+        if not host.available:
+            return 0
+        try:
+            self._resolve_budgets(host)
+        except HOST_ERRORS as e:
+            self.mark_unavailable(host, e)
+            return 0
+        return host.slots
+
+    def total_slots(self):
+        return sum(self.host_slots(host) for host in self.hosts())
+
+    # -------------------------
+    #   UBICACIÓN DE CONTENEDORES
+    # -------------------------
+
+    def host_of(self, container_name):
+        """Host registrado para el contenedor, o None si no se conoce."""
+        with self._lock:
+            name = self._host_by_name.get(container_name)
+        if name is None:
+            placement = ContainerPlacement.query.filter_by(container_name=container_name).first()
+            if placement is None or placement.host not in self._hosts:
+                return None
+            name = placement.host
+            with self._lock:
+                self._host_by_name[container_name] = name
+        return self._hosts.get(name)
+
+    def find(self, container_name):
+        """
+        Retorna (host, contenedor) o (None, None) si no existe. Se consulta
+        primero el host registrado y, si no está ahí, el resto (salvo los que
+        no responden). Lanza `HostUnavailable` si no se encontró y el host
+        registrado no responde: el contenedor puede seguir existiendo ahí.
+        """
+        known = self.host_of(container_name)
+        candidates = [known] if known else []
+        candidates += [host for host in self.hosts() if host is not known]
+        known_failed = False
+        for host in candidates:
+            if not host.available:
+                known_failed = known_failed or host is known
+                continue
+            try:
+                container = host.client.containers.get(container_name)
+            except docker.errors.NotFound:
+                continue
+            except HOST_ERRORS as e:
+                self.mark_unavailable(host, e)
+                known_failed = known_failed or host is known
+                continue
+            if host is not known:
+                self.remember(container_name, host)
+            return host, container
+        if known_failed:
+            raise HostUnavailable(f"Docker host {known.name} of {container_name} is unavailable")
+        return None, None
+
+    def list_containers(self, **kwargs):
+        """
+        `containers.list` en los hosts que responden: lista de (host,
+        contenedor). Los que fallan se omiten (ver `unavailable_hosts`).
+        """
+        result = []
+        for host in self.hosts():
+            if not host.available:
+                continue
+            try:
+                containers = host.client.containers.list(**kwargs)
+            except HOST_ERRORS as e:
+                self.mark_unavailable(host, e)
+                continue
+            result += [(host, container) for container in containers]
+        return result
+
+    def unavailable_hosts(self):
+        """Nombres de los hosts que no responden (sus contenedores no se listan)."""
+        return {host.name for host in self.hosts() if not host.available}
+
+    def on_unavailable_host(self, container_name):
+        """Indica si el contenedor está registrado en un host que no responde."""
+        host = self.host_of(container_name)
+        return host is not None and not host.available
+
+    def remember(self, container_name, host):
+        with self._lock:
+            self._host_by_name[container_name] = host.name
+        placement = ContainerPlacement.query.filter_by(container_name=container_name).first()
+        if placement is None:
+            db.session.add(ContainerPlacement(container_name=container_name, host=host.name))
+        else:
+            placement.host = host.name
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Otro worker lo registró a la vez
+            db.session.rollback()
+            ContainerPlacement.query.filter_by(container_name=container_name).update({"host": host.name})
+            db.session.commit()
+
+    def rename(self, old_name, new_name, host):
+        """Registra el renombre de un contenedor (al asignar uno precalentado)."""
+        self.forget(old_name, new_name)
+        self.remember(new_name, host)
+
+    def forget(self, *container_names):
+        if not container_names:
+            return
+        with self._lock:
+            for name in container_names:
+                self._host_by_name.pop(name, None)
+        ContainerPlacement.query.filter(
+            ContainerPlacement.container_name.in_(container_names)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    # -------------------------
+    #   ELECCIÓN DE HOST
+    # -------------------------
+
+    def load(self):
+        """Contenedores registrados por host."""
+        return Counter(dict(
+            db.session.query(ContainerPlacement.host, db.func.count(ContainerPlacement.id))
+            .group_by(ContainerPlacement.host)
+            .all()
+        ))
+
+    def choose(self):
+        """Host con menos carga; los llenos o caídos solo si no queda otro."""
+        load = self.load()
+
+        def score(host):
+            count = load[host.name]
+            slots = self.host_slots(host)
+            reserved_mb = count * LAB_CONTAINER_MEMORY_MB
+            return (slots == 0, count >= slots, reserved_mb / max(host.memory_mb, 1), count)
+
+        return min(self.hosts(), key=score)
+
+    def summary(self):
+        load = self.load()
+        return [
+            {
+                "name": host.name,
+                "slots": self.host_slots(host),
+                "containers": load[host.name],
+                "memory_budget_mb": host.memory_mb,
+                "cpu_budget": host.cpus,
+                "available": host.available,
+            }
+            for host in self.hosts()
+        ]
+
+    def reconcile(self):
+        """
+        Rehace el registro desde los contenedores que existen en cada host:
+        agrega los que faltan y borra los de contenedores que ya no están.
+        Los registros de hosts que no responden se conservan.
+        """
+        listed_at = datetime.datetime.utcnow()
+        existing = {}
+        for host, container in self.list_containers(all=True):
+            if container.name.startswith(MANAGED_PREFIXES):
+                existing[container.name] = host.name
+        unavailable = self.unavailable_hosts()
+
+        placements = {p.container_name: p for p in ContainerPlacement.query.all()}
+        for name, host_name in existing.items():
+            placement = placements.get(name)
+            if placement is None:
+                db.session.add(ContainerPlacement(container_name=name, host=host_name))
+            elif placement.host != host_name:
+                placement.host = host_name
+        # Un registro creado después de listar puede ser de un contenedor recién creado
+        stale = [
+            name for name, placement in placements.items()
+            if name not in existing and placement.created_at < listed_at
+            and placement.host not in unavailable
+        ]
+        if stale:
+            ContainerPlacement.query.filter(ContainerPlacement.container_name.in_(stale)).delete(synchronize_session=False)
+        db.session.commit()
+        with self._lock:
+            self._host_by_name.clear()
+
+
+placement = HostPlacement()
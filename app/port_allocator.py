@@ -0,0 +1,169 @@
+import os
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import Exercise, PortReservation, db
+from .placement import placement
+
+
+class PortUnavailable(Exception):
+    """El puerto pedido ya está reservado, o no queda ninguno libre."""
+
+
+def container_ports():
+    """Puertos del host publicados por los contenedores en ejecución (todos los hosts)."""
+    used = set()
+    for _, container in placement.list_containers():
+        ports_info = container.attrs["NetworkSettings"]["Ports"] or {}
+        for host_data in ports_info.values():
+            for binding in host_data or []:
+                if binding.get("HostPort"):
+                    used.add(int(binding["HostPort"]))
+    return used
+
+
+class PortAllocator:
+    """
+    Asigna los puertos de los ejercicios dentro de
+    [`PORT_RANGE_START`, `PORT_RANGE_END`).
+
+    Cada worker mantiene un bitmap (`bytearray`, un byte por puerto) y un
+    cursor: buscar el siguiente libre es un `find` sobre el bitmap en vez de
+    cargar todos los ejercicios. La reserva real es la fila `PortReservation`
+    (el puerto es su clave primaria), que se inserta en la misma transacción
+    que el ejercicio; si otro worker tomó el puerto antes, la inserción
+    falla, se marca como usado y se prueba el siguiente. Cuando el bitmap se
+    llena se relee la base de datos, por si otros workers liberaron puertos.
+
+    Al iniciar, `reconcile` crea las reservas que faltan para los ejercicios
+    existentes, borra las de ejercicios que ya no están y marca también los
+    puertos que publican los contenedores en ejecución.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._start = 0
+        self._used = bytearray()
+        self._cursor = 0
+        self._container_ports = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("PORT_RANGE_START", int(os.getenv("PORT_RANGE_START", "8000")))
+        app.config.setdefault("PORT_RANGE_END", int(os.getenv("PORT_RANGE_END", "10000")))
+        self.app = app
+        self._start = app.config["PORT_RANGE_START"]
+        self._used = bytearray(max(0, app.config["PORT_RANGE_END"] - self._start))
+        app.extensions["port_allocator"] = self
+
+    def _index(self, port):
+        index = port - self._start
+        return index if 0 <= index < len(self._used) else None
+
+    def in_range(self, port):
+        """Indica si `port` está en [`PORT_RANGE_START`, `PORT_RANGE_END`)."""
+        return self._index(port) is not None
+
+    def _mark(self, port, used=True):
+        index = self._index(port)
+        if index is not None:
+            self._used[index] = 1 if used else 0
+
+    def load(self):
+        """Rehace el bitmap desde las reservas y los puertos de contenedores."""
+        reserved = [port for (port,) in db.session.query(PortReservation.port)]
+        with self._lock:
+            self._used[:] = bytes(len(self._used))
+            for port in reserved:
+                self._mark(port)
+            for port in self._container_ports:
+                self._mark(port)
+
+    def reconcile(self):
+        """Concilia las reservas con los ejercicios y los contenedores (al iniciar)."""
+        reservations = {r.port: r for r in PortReservation.query.all()}
+        exercise_ids = set()
+        for exercise_id, port in db.session.query(Exercise.id, Exercise.port):
+            exercise_ids.add(exercise_id)
+            # Si dos ejercicios comparten puerto, la reserva queda para el primero
+            if port not in reservations:
+                reservations[port] = PortReservation(port=port, exercise_id=exercise_id)
+                db.session.add(reservations[port])
+        orphaned = [
+            port for port, r in reservations.items()
+            if r.exercise_id is not None and r.exercise_id not in exercise_ids
+        ]
+        if orphaned:
+            PortReservation.query.filter(PortReservation.port.in_(orphaned)).delete(synchronize_session=False)
+        db.session.commit()
+
+        try:
+            self._container_ports = container_ports()
+        except Exception as e:
+            self.app.logger.error(f"Could not list container port bindings: {str(e)}")
+        self.load()
+
+    def _next_free(self):
+        with self._lock:
+            index = self._used.find(0, self._cursor)
+            if index < 0:
+                index = self._used.find(0, 0, self._cursor)
+            if index < 0:
+                return None
+            self._used[index] = 1
+            self._cursor = index + 1
+            return self._start + index
+
+    def allocate(self, exercise):
+        """
+        Asigna un puerto libre a `exercise` (aún sin guardar) y agrega su
+        reserva a la sesión; el llamador hace el commit. Debe llamarse antes
+        de otros cambios pendientes: un conflicto deshace la sesión.
+        """
+        reloaded = False
+        while True:
+            port = self._next_free()
+            if port is None:
+                if reloaded:
+                    raise PortUnavailable("No free ports available in the specified range")
+                self.load()
+                reloaded = True
+                continue
+            if self._reserve(exercise, port):
+                return port
+
+    def claim(self, exercise, port):
+        """Reserva un puerto concreto para `exercise`, o lanza `PortUnavailable`."""
+        with self._lock:
+            self._mark(port)
+        if not self._reserve(exercise, port):
+            raise PortUnavailable(f"Port {port} is already in use")
+        return port
+
+    def _reserve(self, exercise, port):
+        exercise.port = port
+        db.session.add(exercise)
+        db.session.add(PortReservation(port=port, exercise=exercise))
+        try:
+            db.session.flush()
+            return True
+        except IntegrityError:
+            # Lo reservó otro worker; el bit queda marcado
+            db.session.rollback()
+            return False
+
+    def release(self, exercise_id):
+        """Libera los puertos del ejercicio (dentro de la transacción del llamador)."""
+        ports = [
+            port for (port,) in
+            db.session.query(PortReservation.port).filter_by(exercise_id=exercise_id)
+        ]
+        PortReservation.query.filter_by(exercise_id=exercise_id).delete(synchronize_session=False)
+        with self._lock:
+            for port in ports:
+                if port not in self._container_ports:
+                    self._mark(port, used=False)
+
+
+port_allocator = PortAllocator()
@@ -1,110 +1,302 @@
+import os
 import requests
 import re
-from flask import Blueprint, request, jsonify, Response, current_app
+from flask import Blueprint, request, jsonify, Response, current_app, make_response
 import html
 from urllib.parse import urljoin, quote
-from .exercise import decode_token, client
-import bleach
-from bs4 import BeautifulSoup
+from .exercise import decode_token
+from .container_registry import container_registry
+from .upstream import upstream_pool
+from .html_rewriter import rewrite_html, rewrite_cache, rewrite_cache_key, encode_and_cache
+from .asset_cache import asset_cache
+from .compression import compression
+from .metrics import ProxyTimer
+from .activity import activity_tracker
 
 proxy_blueprint = Blueprint('proxy', __name__)
 
+STREAM_CHUNK_SIZE = 64 * 1024
+HOP_BY_HOP_HEADERS = [
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade',
+]
+
+def stream_upstream_response(resp, response_encoding=None):
+    """
+    Reenvía una respuesta no HTML del contenedor por bloques, sin cargarla
+    completa en memoria. Los bytes se envían tal como llegan (sin
+    descomprimir), por lo que `Content-Length`, `Content-Encoding` y las
+    respuestas parciales (`Content-Range`) del contenedor siguen siendo válidas.
+    Si el contenedor no comprimió un recurso de texto y el cliente acepta
+    `response_encoding`, se comprime al vuelo.
+    """
+    headers = [(name, value) for name, value in resp.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS]
+
+    def generate():
+        try:
+            for chunk in resp.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                yield chunk
+        finally:
+            resp.close()
+
+    body = generate()
+    if response_encoding and compression.should_compress(resp.status_code, headers):
+        headers = compression.encoded_headers(headers, response_encoding)
+        body = compression.compress_stream(body, response_encoding)
+
+    return Response(body, resp.status_code, headers=headers, direct_passthrough=True)
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+class UploadStream:
+    """
+    Envuelve `request.stream` para enviarlo al contenedor por bloques.
+    Si el cliente indicó `Content-Length` se expone como `len` y `requests`
+    reenvía ese largo; si no, la subida se envía con `Transfer-Encoding: chunked`.
+    Lanza `RequestBodyTooLarge` si el cuerpo supera `max_size` bytes.
+    """
+
+    def __init__(self, stream, content_length, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.received = 0
+        if content_length is not None:
+            self.len = content_length
+
+    def __iter__(self):
+        while True:
+            chunk = self.stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.received += len(chunk)
+            if self.received > self.max_size:
+                raise RequestBodyTooLarge()
+            yield chunk
+
+@proxy_blueprint.record_once
+def configure_proxy(state):
+    config = state.app.config
+    config.setdefault("PROXY_MAX_BODY_SIZE", int(os.getenv("PROXY_MAX_BODY_SIZE", str(100 * 1024 * 1024))))
+    config.setdefault("HTML_CACHE_MAX_BYTES", int(os.getenv("HTML_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+    config.setdefault("HTML_CACHE_MAX_ITEM_BYTES", int(os.getenv("HTML_CACHE_MAX_ITEM_BYTES", str(2 * 1024 * 1024))))
+    rewrite_cache.configure(config["HTML_CACHE_MAX_BYTES"], config["HTML_CACHE_MAX_ITEM_BYTES"])
+    asset_cache.init_app(state.app)
+    compression.init_app(state.app)
+
+# El HTML se re-serializa en UTF-8 y sin comprimir
+HTML_EXCLUDED_HEADERS = HOP_BY_HOP_HEADERS + ['content-encoding', 'content-length', 'content-type', 'accept-ranges']
+
+def html_response_headers(upstream_headers):
+    headers = [(name, value) for name, value in upstream_headers if name.lower() not in HTML_EXCLUDED_HEADERS]
+    headers.append(('Content-Type', 'text/html; charset=utf-8'))
+    return headers
+
+def render_html(exercise_id, safe_path, body, encoding):
+    """
+    Retorna el HTML reescrito y saneado de una respuesta del contenedor:
+    los bytes guardados en caché si otro alumno ya pidió la misma página,
+    o un generador que lo produce por bloques (y lo guarda al terminar).
+    """
+    # Pages already rewritten for another student of the same exercise
+    cache_key = rewrite_cache_key(exercise_id, safe_path, encoding, body)
+    cached = rewrite_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Raw HTML from the container (an unknown charset falls back to UTF-8)
+    try:
+        html_content = str(body, encoding or 'utf-8', errors='replace')
+    except LookupError:
+        html_content = str(body, 'utf-8', errors='replace')
+
+    # Prepare safe rewriting
+    proxy_prefix = f"/api/exercise/{exercise_id}/proxy/"
+    encoded_path = quote(safe_path, safe="")  # percent-encode the escaped path
+
+    # Rewrite URLs and sanitize in a single pass, emitting the output incrementally
+    chunks = rewrite_html(html_content, proxy_prefix, proxy_prefix + encoded_path)
+    return encode_and_cache(cache_key, chunks)
+
+def cached_asset_response(asset, request_headers):
+    """
+    Responde con un recurso de `asset_cache`, o con 304 si la petición
+    condicional del cliente coincide con su ETag/Last-Modified.
+    """
+    if asset_cache.not_modified(asset, request_headers):
+        return Response(status=304, headers=asset_cache.not_modified_headers(asset))
+    return Response(asset.body, asset.status, headers=asset.headers)
+
 def get_container_ip(container_name):
-    container = client.containers.get(container_name)
-    networks = container.attrs['NetworkSettings']['Networks']
-    if not networks:
-        return None
-    first_network = list(networks.keys())[0]
-    return networks[first_network]['IPAddress']
+    info = container_registry.lookup(container_name)
+    return info.ip if info else None
 
 @proxy_blueprint.route('/api/exercise/<int:exercise_id>/proxy/', defaults={'path': ''}, methods=['GET','POST','PUT','PATCH','DELETE','OPTIONS'])
 @proxy_blueprint.route('/api/exercise/<int:exercise_id>/proxy/<path:path>', methods=['GET','POST','PUT','PATCH','DELETE','OPTIONS'])
 def proxy_to_exercise(exercise_id, path=""):
-    decoded = decode_token()
+    timer = ProxyTimer(request.method)
+    response = make_response(forward_to_exercise(exercise_id, path, timer))
+    return timer.attach(response)
+
+def forward_to_exercise(exercise_id, path, timer):
+    """
+    Reenvía la petición actual al contenedor del alumno, registrando en
+    `timer` el tiempo de cada etapa.
+    """
+    with timer.stage("jwt_decode"):
+        decoded = decode_token()
     if not decoded:
         return jsonify({"error": "Unauthorized"}), 401
 
     user_id = decoded["user_id"]
-    proxy_prefix = f"/api/exercise/{exercise_id}/proxy"
 
     container_name = f"user-{user_id}-exercise-{exercise_id}"
 
     try:
-        container = client.containers.get(container_name)
+        with timer.stage("container_lookup"):
+            container_info = container_registry.lookup(container_name)
     except Exception as e:
         current_app.logger.error(f"RequestException occurred: {str(e)}")
         return jsonify({"error": "An internal error occurred"}), 404
+    if container_info is None:
+        return jsonify({"error": "Container not found"}), 404
+    timer.exercise = str(exercise_id)
+    activity_tracker.touch(container_name)
 
-    container_ip = get_container_ip(container_name)
+    with timer.stage("ip_resolution"):
+        container_ip = container_info.ip
+        safe_path = html.escape(path)
+        internal_url = f"http://{container_ip}:5000/{safe_path}"
     if not container_ip:
         return jsonify({"error": "No container IP found"}), 500
 
-    safe_path = html.escape(path)
-    internal_url = f"http://{container_ip}:5000/{safe_path}"
+    max_body_size = current_app.config["PROXY_MAX_BODY_SIZE"]
+    if request.content_length is not None and request.content_length > max_body_size:
+        return jsonify({"error": "Request body too large"}), 413
+
+    response_encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+
+    # Static assets already served by this student's container
+    asset_key = None
+    cached_asset = None
+    if asset_cache.is_cacheable_request(request.method, request.headers):
+        with timer.stage("asset_cache"):
+            asset_key = asset_cache.key(
+                exercise_id, container_info.id, safe_path,
+                request.query_string, request.headers.get('Accept-Encoding'),
+            )
+            cached_asset = asset_cache.get(asset_key)
+        if cached_asset is not None and cached_asset.is_fresh():
+            return cached_asset_response(cached_asset, request.headers)
 
     try:
-        resp = requests.request(
-            method=request.method,
-            url=internal_url,
-            headers={key: value for key, value in request.headers if key.lower() != 'host'},
-            params=request.args,
-            data=request.get_data(),
-            allow_redirects=False,
+        # requests calcula Content-Length/Transfer-Encoding según el cuerpo que enviamos
+        forward_headers = {
+            key: value for key, value in request.headers
+            if key.lower() not in ('host', 'content-length', 'transfer-encoding')
+        }
+        if cached_asset is not None:
+            # Revalidamos la copia vencida con los validadores del contenedor
+            for key in ('If-None-Match', 'If-Modified-Since'):
+                forward_headers.pop(key, None)
+            if cached_asset.etag:
+                forward_headers['If-None-Match'] = cached_asset.etag
+            if cached_asset.last_modified:
+                forward_headers['If-Modified-Since'] = cached_asset.last_modified
+        # Sin cuerpo (p. ej. un GET) no se envía nada: un cuerpo chunked vacío
+        # dejaría `0\r\n\r\n` en la conexión reutilizada del pool
+        has_body = (
+            bool(request.content_length)
+            or 'chunked' in request.headers.get('Transfer-Encoding', '').lower()
         )
+        body = UploadStream(request.stream, request.content_length, max_body_size) if has_body else None
+        try:
+            with timer.stage("upstream_request"):
+                resp = upstream_pool.request(
+                    container_ip,
+                    request.method,
+                    internal_url,
+                    headers=forward_headers,
+                    params=request.args,
+                    data=body,
+                    allow_redirects=False,
+                    stream=True,
+                )
+        finally:
+            timer.request_bytes = body.received if body is not None else 0
 
-        excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
-        headers = [(name, value) for name, value in resp.headers.items() if name.lower() not in excluded_headers]
-
-        content = resp.content
         content_type = resp.headers.get('Content-Type', '')
 
-        if 'text/html' in content_type:
-            # Raw HTML from the container
-            html_content = resp.text
-
-            # Prepare safe rewriting
-            proxy_prefix = f"/api/exercise/{exercise_id}/proxy/"
-            encoded_path = quote(safe_path, safe="")  # percent-encode the escaped path
-
-            # Parse HTML safely
-            soup = BeautifulSoup(html_content, "html.parser")
-
-            # Rewrite href/src attributes
-            for tag in soup.find_all(["a", "link", "script", "img"]):
-                attr = "href" if tag.name in ["a", "link"] else "src"
-                if tag.has_attr(attr):
-                    url = tag[attr]
-                    if url.startswith("/"):
-                        tag[attr] = proxy_prefix + url.lstrip("/")
-                    elif url.startswith("./"):
-                        tag[attr] = proxy_prefix + url[2:]
-
-            # Rewrite form actions
-            for form in soup.find_all("form"):
-                form["action"] = proxy_prefix + encoded_path
-
-            # Define a stricter bleach Cleaner
-            ALLOWED_TAGS = bleach.sanitizer.ALLOWED_TAGS + ["form", "input", "button"]
-            ALLOWED_ATTRS = {
-                **bleach.sanitizer.ALLOWED_ATTRIBUTES,
-                "form": ["action", "method"],
-                "input": ["type", "name", "value"],
-                "button": ["type", "name"],
-            }
-
-            cleaner = bleach.Cleaner(
-                tags=ALLOWED_TAGS,
-                attributes=ALLOWED_ATTRS,
-                protocols=["http", "https"],
-                strip=True
-            )
+        if cached_asset is not None and resp.status_code == 304:
+            resp.close()
+            asset_cache.refresh(asset_key, cached_asset, resp.headers)
+            return cached_asset_response(cached_asset, request.headers)
+
+        if 'text/html' not in content_type:
+            content_length = resp.headers.get('Content-Length', '')
+            if (
+                asset_key is not None
+                and content_length.isdigit()
+                and int(content_length) <= asset_cache.max_item_bytes
+                and asset_cache.freshness_lifetime(resp.status_code, resp.headers) is not None
+            ):
+                with timer.stage("upstream_request"):
+                    asset_body = resp.raw.read(decode_content=False)
+                resp.close()
+                with timer.stage("response_build"):
+                    asset_headers = list(resp.headers.items())
+                    if response_encoding and compression.should_compress(resp.status_code, asset_headers, len(asset_body)):
+                        # Se guarda ya comprimido: la clave incluye el Accept-Encoding del cliente
+                        asset_body = compression.compress(asset_body, response_encoding)
+                        asset_headers = compression.encoded_headers(asset_headers, response_encoding)
+                        asset_headers.append(('Content-Length', str(len(asset_body))))
+                    asset = asset_cache.put(asset_key, resp.status_code, asset_headers, asset_body)
+                    return cached_asset_response(asset, request.headers)
+            with timer.stage("response_build"):
+                return stream_upstream_response(resp, response_encoding)
+
+        if resp.status_code == 206 and request.method in ('GET', 'HEAD'):
+            # Un rango parcial de HTML no se puede reescribir: pedimos el documento completo
+            resp.close()
+            for key in ('Range', 'If-Range'):
+                forward_headers.pop(key, None)
+            with timer.stage("upstream_request"):
+                resp = upstream_pool.request(
+                    container_ip,
+                    request.method,
+                    internal_url,
+                    headers=forward_headers,
+                    params=request.args,
+                    allow_redirects=False,
+                    stream=True,
+                )
+
+            if 'text/html' not in resp.headers.get('Content-Type', ''):
+                return stream_upstream_response(resp, response_encoding)
 
-            # Clean the rewritten HTML
-            clean_html = cleaner.clean(str(soup))
-            content = clean_html.encode("utf-8")
+        with timer.stage("upstream_request"):
+            upstream_body = resp.content
+        with timer.stage("html_rewrite"):
+            content = render_html(exercise_id, safe_path, upstream_body, resp.encoding)
+        if not isinstance(content, bytes):
+            # La reescritura ocurre a medida que se envía la respuesta
+            content = timer.timed_iter("html_rewrite", content)
 
-        return Response(content, resp.status_code, headers=headers)
+        with timer.stage("response_build"):
+            headers = html_response_headers(resp.headers.items())
+            if response_encoding and compression.should_compress(resp.status_code, headers, len(upstream_body)):
+                headers = compression.encoded_headers(headers, response_encoding)
+                if isinstance(content, bytes):
+                    content = compression.compress(content, response_encoding)
+                else:
+                    content = compression.compress_stream(content, response_encoding)
+            return Response(content, resp.status_code, headers=headers)
 
+    except RequestBodyTooLarge:
+        return jsonify({"error": "Request body too large"}), 413
+    except requests.exceptions.Timeout as e:
+        current_app.logger.error(f"Upstream timeout for {container_name}: {str(e)}")
+        return jsonify({"error": "The exercise container did not respond in time"}), 504
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"RequestException occurred: {str(e)}")
         return jsonify({"error": "An internal error occurred"}), 502
@@ -1,12 +1,17 @@
 import json
 import bleach
 from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import IntegrityError
 from .models import (
     ExerciseQuestion, ExerciseAnswer,
     ExerciseGroup, GroupExerciseAnswer,
     User, db
 )
 from .exercise import decode_token
+from .answers import (
+    PageArgsError, answers_listing, group_answers_query,
+    individual_answers_query, parse_page_args
+)
 
 question_blueprint = Blueprint('questions', __name__)
 
@@ -218,7 +223,12 @@ def submit_answer(exercise_id, question_id):
                 answer_text=answer_text
             )
             db.session.add(group_answer)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # El compañero la envió al mismo tiempo
+                db.session.rollback()
+                return jsonify({'error': 'Ya se envió la respuesta grupal para esta pregunta'}), 400
             return jsonify({'message': 'Respuesta grupal enviada, válida para ambos integrantes'}), 200
     else:
         # Si el usuario no pertenece a un grupo, se procede con la respuesta individual.
@@ -235,7 +245,12 @@ def submit_answer(exercise_id, question_id):
             answer_text=answer_text
         )
         db.session.add(new_answer)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Doble envío simultáneo: la primera respuesta es la que vale
+            db.session.rollback()
+            return jsonify({'error': 'Ya respondiste esta pregunta, no se puede editar.'}), 400
         return jsonify({'message': 'Respuesta individual enviada'}), 201
 
 
@@ -243,6 +258,7 @@ def submit_answer(exercise_id, question_id):
 def list_answers(exercise_id):
     """
     Lista todas las respuestas (individuales y grupales) de los usuarios para las preguntas de un ejercicio (solo admin).
+    Admite paginación por clave y proyección de campos (ver `parse_page_args`).
     """
     decoded = decode_token()
     if not decoded:
@@ -252,55 +268,43 @@ def list_answers(exercise_id):
     if not user or not user.is_admin:
         return jsonify({'error': 'Forbidden'}), 403
 
-    # Obtenemos todas las preguntas del ejercicio
-    questions = ExerciseQuestion.query.filter_by(exercise_id=exercise_id).all()
-    question_ids = [q.id for q in questions]
-
-    # 1. Respuestas individuales
-    individual_answers_query = ExerciseAnswer.query.filter(
-        ExerciseAnswer.question_id.in_(question_ids)
-    ).all()
-    individual_answers = []
-    for ans in individual_answers_query:
-        answer_user = User.query.get(ans.user_id)
-        individual_answers.append({
-            'answer_id': ans.id,
-            'question_id': ans.question_id,
-            'answer_text': ans.answer_text,
-            'score': ans.score,
-            'feedback': ans.feedback,
+    try:
+        page = parse_page_args(request.args)
+    except PageArgsError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def individual_item(row):
+        return {
+            'answer_id': row.answer_id,
+            'question_id': row.question_id,
+            'answer_text': row.answer_text,
+            'score': row.score,
+            'feedback': row.feedback,
             'user': {
-                'id': ans.user_id,
-                'email': answer_user.email if answer_user else 'N/D'
+                'id': row.user_id,
+                'email': row.user_email or 'N/D'
             }
-        })
-
-    # 2. Respuestas grupales: unimos la respuesta de grupo con la información del grupo
-    group_answers_query = GroupExerciseAnswer.query.join(
-        ExerciseGroup, GroupExerciseAnswer.group_id == ExerciseGroup.id
-    ).filter(ExerciseGroup.exercise_id == exercise_id).all()
-    group_answers = []
-    for ans in group_answers_query:
-        group = ExerciseGroup.query.get(ans.group_id)
-        leader = User.query.get(group.leader_id) if group else None
-        partner = User.query.get(group.partner_id) if group and group.partner_id else None
-
-        group_answers.append({
-            'answer_id': ans.id,
-            'question_id': ans.question_id,
-            'answer_text': ans.answer_text,
-            'score': ans.score,
+        }
+
+    def group_item(row):
+        return {
+            'answer_id': row.answer_id,
+            'question_id': row.question_id,
+            'answer_text': row.answer_text,
+            'score': row.score,
             'group': {
-                'id': group.id if group else None,
-                'leader_email': leader.email if leader else 'N/D',
-                'partner_email': partner.email if partner else None,
+                'id': row.group_id,
+                'leader_email': row.leader_email or 'N/D',
+                'partner_email': row.partner_email,
             }
-        })
-
-    return jsonify({
-        'individual_answers': individual_answers,
-        'group_answers': group_answers
-    }), 200
+        }
+
+    # Una consulta por lista: pregunta, alumno, grupo, líder y compañero van en el mismo JOIN
+    return jsonify(answers_listing(
+        individual_answers_query(exercise_id),
+        group_answers_query(exercise_id),
+        page, individual_item, group_item
+    )), 200
 
 
 @question_blueprint.route('/api/exercise/<int:exercise_id>/answer/<int:answer_id>/evaluate', methods=['PATCH'])
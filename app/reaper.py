@@ -0,0 +1,287 @@
+import datetime
+import fcntl
+import heapq
+import os
+import threading
+
+from .activity import activity_tracker
+from .container_registry import LAB_CONTAINER_RE
+from .models import ContainerLease, db
+from .placement import placement
+from .teardown import container_teardown
+
+
+def utcnow():
+    return datetime.datetime.utcnow()
+
+
+def parse_docker_time(value):
+    """Convierte `Created` de Docker (RFC 3339 con nanosegundos) a datetime UTC."""
+    try:
+        return datetime.datetime.strptime((value or "")[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return None
+
+
+class ContainerReaper:
+    """
+    Elimina los contenedores de laboratorio cuando vence su plazo
+    (`CONTAINER_TTL_SECONDS` desde que se iniciaron, extensible) o cuando
+    llevan `CONTAINER_IDLE_SECONDS` sin tráfico en el proxy (ver
+    `activity_tracker`); lo que ocurra primero.
+
+    Cada contenedor tiene un `ContainerLease` en la base de datos, así que los
+    plazos sobreviven a reinicios. Un único hilo, en el worker que obtiene el
+    lock de archivo `REAPER_LOCK_FILE`, mantiene un min-heap con los
+    vencimientos próximos, duerme hasta el siguiente y elimina por lotes los
+    contenedores vencidos. Los demás workers solo crean, extienden o liberan
+    plazos; el líder los recoge al sincronizar el heap con la base de datos
+    cada `REAPER_SYNC_SECONDS`.
+
+    Al asumir el liderazgo se concilian los plazos con los contenedores de
+    todos los hosts: los contenedores sin plazo (p. ej. iniciados antes de
+    un despliegue) reciben uno contado desde su creación, y los plazos de
+    contenedores que ya no existen se eliminan. También se rehace el
+    registro de hosts de `placement`.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._heap = []  # (vencimiento, nombre)
+        self._heap_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock_file = None
+
+    def init_app(self, app):
+        app.config.setdefault("CONTAINER_TTL_SECONDS", int(os.getenv("CONTAINER_TTL_SECONDS", "7200")))
+        # 0 desactiva la eliminación por inactividad
+        app.config.setdefault("CONTAINER_IDLE_SECONDS", int(os.getenv("CONTAINER_IDLE_SECONDS", "1800")))
+        app.config.setdefault("CONTAINER_IDLE_GRACE_SECONDS", int(os.getenv("CONTAINER_IDLE_GRACE_SECONDS", "300")))
+        app.config.setdefault("REAPER_SYNC_SECONDS", int(os.getenv("REAPER_SYNC_SECONDS", "30")))
+        app.config.setdefault("REAPER_BATCH_SIZE", int(os.getenv("REAPER_BATCH_SIZE", "50")))
+        app.config.setdefault(
+            "REAPER_LOCK_FILE",
+            os.getenv("REAPER_LOCK_FILE", os.path.join(app.instance_path, "reaper.lock")),
+        )
+        app.config.setdefault(
+            "REAPER_ENABLED",
+            os.getenv("REAPER_ENABLED", "true").lower() in ["true", "1", "yes"],
+        )
+        self.app = app
+        app.extensions["container_reaper"] = self
+
+    # -------------------------
+    #   PLAZOS
+    # -------------------------
+
+    def schedule(self, name, user_id, exercise_id, ttl=None):
+        """Crea (o reinicia) el plazo del contenedor `name`."""
+        ttl = ttl if ttl is not None else self.app.config["CONTAINER_TTL_SECONDS"]
+        now = utcnow()
+        expires_at = now + datetime.timedelta(seconds=ttl)
+        lease = ContainerLease.query.filter_by(container_name=name).first()
+        if lease is None:
+            lease = ContainerLease(container_name=name, user_id=user_id, exercise_id=exercise_id)
+            db.session.add(lease)
+        lease.expires_at = expires_at
+        lease.last_activity = now
+        db.session.commit()
+        self._push(self.effective_deadline(lease), name)
+        return expires_at
+
+    def extend(self, name, seconds=None):
+        """
+        Extiende el plazo hasta `seconds` desde ahora (nunca lo acorta) y
+        cuenta como actividad. Retorna el nuevo vencimiento, o None si el
+        contenedor no tiene plazo.
+        """
+        seconds = seconds if seconds is not None else self.app.config["CONTAINER_TTL_SECONDS"]
+        lease = ContainerLease.query.filter_by(container_name=name).first()
+        if lease is None:
+            return None
+        now = utcnow()
+        lease.expires_at = max(lease.expires_at, now + datetime.timedelta(seconds=seconds))
+        lease.last_activity = now
+        db.session.commit()
+        return lease.expires_at
+
+    def release(self, *names):
+        """Elimina los plazos de contenedores que se detuvieron por otra vía."""
+        if names:
+            ContainerLease.query.filter(ContainerLease.container_name.in_(names)).delete(synchronize_session=False)
+            db.session.commit()
+
+    def idle_deadline(self, lease):
+        """Momento en que el contenedor se elimina si no hay más actividad."""
+        idle_seconds = self.app.config["CONTAINER_IDLE_SECONDS"]
+        if not idle_seconds:
+            return None
+        # La actividad aún no volcada de este worker también cuenta
+        last_activity = max(filter(None, [
+            lease.last_activity, lease.created_at, activity_tracker.last_seen(lease.container_name),
+        ]))
+        return last_activity + datetime.timedelta(seconds=idle_seconds)
+
+    def effective_deadline(self, lease):
+        idle_deadline = self.idle_deadline(lease)
+        return min(lease.expires_at, idle_deadline) if idle_deadline else lease.expires_at
+
+    def deadline(self, name):
+        """
+        Retorna un dict con el vencimiento del plazo (`expires_at`), el de
+        inactividad (`idle_expires_at`) y si este último está dentro del
+        periodo de aviso (`idle_warning`), o None si el contenedor no tiene plazo.
+        """
+        lease = ContainerLease.query.filter_by(container_name=name).first()
+        if lease is None:
+            return None
+        idle_deadline = self.idle_deadline(lease)
+        grace = datetime.timedelta(seconds=self.app.config["CONTAINER_IDLE_GRACE_SECONDS"])
+        return {
+            "expires_at": lease.expires_at,
+            "idle_expires_at": idle_deadline,
+            "idle_warning": bool(idle_deadline and idle_deadline - grace <= utcnow() < lease.expires_at),
+        }
+
+    def _push(self, expires_at, name):
+        with self._heap_lock:
+            heapq.heappush(self._heap, (expires_at, name))
+        self._wakeup.set()
+
+    # -------------------------
+    #   PLANIFICADOR
+    # -------------------------
+
+    def start(self):
+        """Inicia el hilo del planificador (una vez creadas las tablas)."""
+        if self._thread is not None or not self.app.config["REAPER_ENABLED"]:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _try_lead(self):
+        """Intenta obtener el lock de líder (no bloqueante)."""
+        lock_file = open(self.app.config["REAPER_LOCK_FILE"], "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        sync_seconds = self.app.config["REAPER_SYNC_SECONDS"]
+        # Solo un worker planifica; los demás reintentan por si el líder muere
+        while not self._try_lead():
+            self._wakeup.wait(sync_seconds)
+            self._wakeup.clear()
+
+        reconciled = False
+        next_sync = utcnow()
+        while True:
+            try:
+                with self.app.app_context():
+                    if not reconciled:
+                        self.reconcile()
+                        reconciled = True
+                    if utcnow() >= next_sync:
+                        self._sync()
+                        next_sync = utcnow() + datetime.timedelta(seconds=sync_seconds)
+                    self.reap_due()
+            except Exception as e:
+                self.app.logger.error(f"Container reaper iteration failed: {str(e)}")
+                next_sync = utcnow() + datetime.timedelta(seconds=sync_seconds)
+
+            with self._heap_lock:
+                wake_at = min(self._heap[0][0], next_sync) if self._heap else next_sync
+            self._wakeup.wait(max(0.0, (wake_at - utcnow()).total_seconds()))
+            self._wakeup.clear()
+
+    def _sync(self):
+        """Carga en el heap los plazos que vencen antes de la próxima sincronización."""
+        horizon = utcnow() + datetime.timedelta(seconds=2 * self.app.config["REAPER_SYNC_SECONDS"])
+        due = ContainerLease.expires_at <= horizon
+        idle_seconds = self.app.config["CONTAINER_IDLE_SECONDS"]
+        if idle_seconds:
+            due = due | (ContainerLease.last_activity <= horizon - datetime.timedelta(seconds=idle_seconds))
+        leases = ContainerLease.query.filter(due).all()
+        with self._heap_lock:
+            known = set(self._heap)
+            for lease in leases:
+                entry = (self.effective_deadline(lease), lease.container_name)
+                if entry not in known:
+                    heapq.heappush(self._heap, entry)
+
+    def reap_due(self):
+        """Elimina, en lotes de `REAPER_BATCH_SIZE`, los contenedores vencidos."""
+        batch_size = self.app.config["REAPER_BATCH_SIZE"]
+        while True:
+            now = utcnow()
+            due = set()
+            with self._heap_lock:
+                while self._heap and self._heap[0][0] <= now and len(due) < batch_size:
+                    due.add(heapq.heappop(self._heap)[1])
+            if not due:
+                return
+
+            # El heap puede estar desactualizado: la base de datos manda
+            activity_tracker.flush()
+            leases = ContainerLease.query.filter(ContainerLease.container_name.in_(due)).all()
+            expired = []
+            for lease in leases:
+                deadline = self.effective_deadline(lease)
+                if deadline <= now:
+                    reason = "its lease expired" if lease.expires_at <= now else "being idle"
+                    expired.append((lease.container_name, reason))
+                else:
+                    # El plazo se extendió (o hubo actividad) desde que entró al heap
+                    self._push(deadline, lease.container_name)
+
+            # Los que fallan conservan su plazo y se reintentan en la próxima sincronización
+            results = container_teardown.remove_all([name for name, _ in expired])
+            reaped = []
+            for name, reason in expired:
+                if results[name] is None:
+                    reaped.append(name)
+                    self.app.logger.info(f"{name} was stopped and removed after {reason}")
+            self.release(*reaped)
+
+    def reconcile(self):
+        """Concilia los plazos guardados con los contenedores que existen."""
+        placement.reconcile()
+        listed_at = utcnow()
+        containers = placement.list_containers(all=True, filters={"name": "user-"})
+        existing = {}
+        for _, container in containers:
+            match = LAB_CONTAINER_RE.match(container.name)
+            if match:
+                existing[container.name] = (container, match)
+
+        leases = {lease.container_name: lease for lease in ContainerLease.query.all()}
+        ttl = datetime.timedelta(seconds=self.app.config["CONTAINER_TTL_SECONDS"])
+        for name, (container, match) in existing.items():
+            if name in leases:
+                continue
+            created = parse_docker_time(container.attrs.get("Created")) or utcnow()
+            db.session.add(ContainerLease(
+                container_name=name,
+                user_id=int(match.group(1)),
+                exercise_id=int(match.group(2)),
+                expires_at=created + ttl,
+                last_activity=listed_at,
+            ))
+        # Un plazo creado después de listar puede ser de un contenedor recién iniciado,
+        # y los contenedores de un host que no responde no aparecen en la lista
+        orphaned = [
+            name for name, lease in leases.items()
+            if name not in existing and lease.created_at < listed_at
+            and not placement.on_unavailable_host(name)
+        ]
+        if orphaned:
+            ContainerLease.query.filter(ContainerLease.container_name.in_(orphaned)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+container_reaper = ContainerReaper()
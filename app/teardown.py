@@ -0,0 +1,117 @@
+import datetime
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from .container_registry import container_registry
+from .models import TeardownBatch, TeardownItem, db
+from .placement import placement
+from .upstream import upstream_pool
+
+
+def remove_container(name):
+    """Detiene y elimina el contenedor `name` (en el host donde esté), si todavía existe."""
+    _, container = placement.find(name)
+    try:
+        if container is not None:
+            upstream_pool.evict_container(container)
+            container.remove(force=True)
+    except docker.errors.NotFound:
+        # El contenedor ya no existe (probablemente alguien más lo removió)
+        pass
+    except docker.errors.APIError as e:
+        # Docker ya lo está eliminando: no hacemos nada extra
+        if not ("removal of container" in str(e) and "is already in progress" in str(e)):
+            raise
+    container_registry.forget(name)
+    placement.forget(name)
+
+
+class ContainerTeardown:
+    """
+    Elimina muchos contenedores a la vez (al cerrar sesión, al borrar un
+    ejercicio o al vencer varios plazos juntos).
+
+    Las eliminaciones corren en un pool de hilos acotado
+    (`TEARDOWN_WORKERS`), así que borrar un ejercicio con decenas de
+    contenedores tarda lo que tarda el más lento y no la suma de todos. Con
+    `submit` la petición HTTP retorna enseguida: el resultado de cada
+    contenedor queda en `TeardownItem` y se consulta por el id del lote.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+
+    def init_app(self, app):
+        app.config.setdefault("TEARDOWN_WORKERS", int(os.getenv("TEARDOWN_WORKERS", "16")))
+        self.app = app
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config["TEARDOWN_WORKERS"],
+            thread_name_prefix="container-teardown",
+        )
+        app.extensions["container_teardown"] = self
+
+    def _remove(self, name):
+        """Retorna None si se eliminó, o el mensaje de error."""
+        try:
+            # Corre en un hilo del pool: necesita su propio contexto para la base de datos
+            with self.app.app_context():
+                remove_container(name)
+            return None
+        except Exception as e:
+            self.app.logger.error(f"Failed to remove container {name}: {str(e)}")
+            return str(e)
+
+    def remove_all(self, names):
+        """Elimina los contenedores en paralelo y espera: {nombre: error o None}."""
+        futures = {name: self._executor.submit(self._remove, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def submit(self, names, reason, requested_by=None):
+        """Registra un lote y lo elimina en segundo plano. Retorna el lote."""
+        batch = TeardownBatch(id=secrets.token_hex(16), reason=reason, requested_by=requested_by)
+        batch.items = [TeardownItem(container_name=name) for name in names]
+        db.session.add(batch)
+        db.session.commit()
+        for name in names:
+            self._executor.submit(self._run_item, batch.id, name)
+        return batch
+
+    def _run_item(self, batch_id, name):
+        error = self._remove(name)
+        with self.app.app_context():
+            try:
+                item = TeardownItem.query.filter_by(batch_id=batch_id, container_name=name).first()
+                if item is not None:
+                    item.state = "failed" if error else "removed"
+                    item.error = error
+                    item.updated_at = datetime.datetime.utcnow()
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Failed to record teardown of {name}: {str(e)}")
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def summary(batch):
+        items = [
+            {"container": item.container_name, "state": item.state, "error": item.error}
+            for item in batch.items
+        ]
+        pending = sum(1 for item in items if item["state"] == "pending")
+        return {
+            "id": batch.id,
+            "reason": batch.reason,
+            "created_at": batch.created_at.isoformat() + "Z",
+            "done": pending == 0,
+            "pending": pending,
+            "failed": sum(1 for item in items if item["state"] == "failed"),
+            "containers": items,
+        }
+
+
+container_teardown = ContainerTeardown()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamPool:
+    """
+    Pool de conexiones keep-alive hacia los contenedores de ejercicios.
+
+    Mantiene una `requests.Session` por IP de contenedor, cada una con un
+    número acotado de conexiones reutilizables. Las sesiones que no se usan
+    durante `PROXY_POOL_IDLE_SECONDS` se cierran, y las de un contenedor
+    detenido o eliminado se descartan con `evict_container`.
+    """
+
+    def __init__(self, app=None):
+        self._sessions = {}  # ip -> [session, último uso]
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.connect_timeout = 3.05
+        self.read_timeout = 30.0
+        self.pool_maxsize = 10
+        self.max_hosts = 256
+        self.idle_seconds = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PROXY_CONNECT_TIMEOUT", float(os.getenv("PROXY_CONNECT_TIMEOUT", "3.05")))
+        app.config.setdefault("PROXY_READ_TIMEOUT", float(os.getenv("PROXY_READ_TIMEOUT", "30")))
+        app.config.setdefault("PROXY_POOL_MAXSIZE", int(os.getenv("PROXY_POOL_MAXSIZE", "10")))
+        app.config.setdefault("PROXY_POOL_MAX_HOSTS", int(os.getenv("PROXY_POOL_MAX_HOSTS", "256")))
+        app.config.setdefault("PROXY_POOL_IDLE_SECONDS", int(os.getenv("PROXY_POOL_IDLE_SECONDS", "300")))
+
+        self.connect_timeout = app.config["PROXY_CONNECT_TIMEOUT"]
+        self.read_timeout = app.config["PROXY_READ_TIMEOUT"]
+        self.pool_maxsize = app.config["PROXY_POOL_MAXSIZE"]
+        self.max_hosts = app.config["PROXY_POOL_MAX_HOSTS"]
+        self.idle_seconds = app.config["PROXY_POOL_IDLE_SECONDS"]
+        app.extensions["upstream_pool"] = self
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def _new_session(self):
+        session = requests.Session()
+        # El proxy reenvía las cabeceras del cliente tal cual: la sesión
+        # compartida no debe guardar cookies ni leer proxies del entorno.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.trust_env = False
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0,
+        )
+        session.mount("http://", adapter)
+        return session
+
+    def _sweep_locked(self, now):
+        """Cierra las sesiones ociosas. Debe llamarse con el lock tomado."""
+        self._last_sweep = now
+        for ip, (session, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_seconds:
+                del self._sessions[ip]
+                session.close()
+
+    def session_for(self, ip):
+        """
+        Retorna la sesión asociada a `ip`, creándola si no existe.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep > self.idle_seconds:
+                self._sweep_locked(now)
+
+            entry = self._sessions.get(ip)
+            if entry is None:
+                if len(self._sessions) >= self.max_hosts:
+                    # Descartamos la sesión usada hace más tiempo
+                    oldest_ip = min(self._sessions, key=lambda k: self._sessions[k][1])
+                    self._sessions.pop(oldest_ip)[0].close()
+                entry = [self._new_session(), now]
+                self._sessions[ip] = entry
+            entry[1] = now
+            return entry[0]
+
+    def request(self, ip, method, url, **kwargs):
+        """
+        Equivalente a `requests.request`, pero reutilizando las conexiones
+        abiertas hacia `ip` y aplicando los timeouts configurados.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session_for(ip).request(method, url, **kwargs)
+
+    def evict(self, ip):
+        with self._lock:
+            entry = self._sessions.pop(ip, None)
+        if entry:
+            entry[0].close()
+
+    def evict_container(self, container):
+        """
+        Cierra las conexiones hacia todas las IPs de un contenedor.
+        Se usa al detener o eliminar contenedores.
+        """
+        try:
+            networks = container.attrs["NetworkSettings"]["Networks"] or {}
+        except (KeyError, TypeError):
+            return
+        for network in networks.values():
+            ip = network.get("IPAddress")
+            if ip:
+                self.evict(ip)
+
+    def evict_idle(self):
+        with self._lock:
+            self._sweep_locked(time.monotonic())
+
+    def close_all(self):
+        with self._lock:
+            sessions = [entry[0] for entry in self._sessions.values()]
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+upstream_pool = UpstreamPool()
@@ -0,0 +1,203 @@
+import codecs
+import csv
+import json
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_bcrypt import generate_password_hash
+from sqlalchemy.exc import IntegrityError
+
+from .models import User, db
+
+# Correos por consulta `IN` (SQLite limita la cantidad de parámetros)
+EMAIL_LOOKUP_CHUNK = 500
+
+CSV_FIELDS = ["email", "first_name", "last_name"]
+
+
+class UserImportError(ValueError):
+    """El contenido enviado no se puede leer como lista de usuarios."""
+
+
+def hash_password(password):
+    """Igual que `User.set_password`; corre en los hilos del pool."""
+    return generate_password_hash(password).decode('utf-8')
+
+
+def read_csv(stream):
+    """
+    Usuarios de un CSV (bytes). Con encabezado se usan las columnas
+    `email`, `first_name` y `last_name`; sin él, se toman en ese orden.
+    """
+    text = codecs.getreader("utf-8-sig")(stream)
+    reader = csv.reader(text)
+    header = None
+    for row in reader:
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if header is None:
+            lowered = [cell.lower() for cell in cells]
+            if "email" in lowered:
+                header = lowered
+                continue
+            header = CSV_FIELDS
+        yield dict(zip(header, cells))
+
+
+def read_ndjson(stream):
+    """Usuarios de un NDJSON (bytes): un objeto por línea, leído a medida que llega."""
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise UserImportError(f"Invalid JSON on line {number}")
+        if not isinstance(item, dict):
+            raise UserImportError(f"Line {number} is not an object")
+        yield item
+
+
+class UserImporter:
+    """
+    Crea usuarios en masa con contraseñas temporales.
+
+    Los correos ya registrados se buscan con consultas `IN` (una por cada
+    `EMAIL_LOOKUP_CHUNK` correos, no una por usuario), las contraseñas se
+    hashean con bcrypt en un pool de hilos (`USER_IMPORT_HASH_WORKERS`;
+    bcrypt es lento a propósito y libera el GIL mientras calcula) y todos los usuarios nuevos se insertan en
+    una sola transacción.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "USER_IMPORT_HASH_WORKERS",
+            int(os.getenv("USER_IMPORT_HASH_WORKERS", str(os.cpu_count() or 2))),
+        )
+        app.config.setdefault("USER_IMPORT_MAX_USERS", int(os.getenv("USER_IMPORT_MAX_USERS", "5000")))
+        self.app = app
+        app.extensions["user_importer"] = self
+
+    def _pool(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # Hilos y no procesos: un fork del worker heredaría los locks
+                # tomados por sus otros hilos y las conexiones del pool de la base
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config["USER_IMPORT_HASH_WORKERS"],
+                    thread_name_prefix="user-import-hash",
+                )
+            return self._executor
+
+    def hash_all(self, passwords):
+        if len(passwords) <= 1:
+            return [hash_password(p) for p in passwords]
+        return list(self._pool().map(hash_password, passwords))
+
+    def parse(self, req):
+        """
+        Lee los usuarios de la petición: JSON (`{"users": [...]}`), NDJSON
+        (`application/x-ndjson`), CSV en el cuerpo (`text/csv`) o CSV subido
+        como archivo `file` en un formulario.
+        """
+        content_type = (req.mimetype or "").lower()
+        if content_type == "multipart/form-data":
+            upload = req.files.get("file")
+            if upload is None:
+                raise UserImportError("Missing CSV file")
+            entries = read_csv(upload.stream)
+        elif content_type == "text/csv":
+            entries = read_csv(req.stream)
+        elif content_type in ("application/x-ndjson", "application/jsonlines"):
+            entries = read_ndjson(req.stream)
+        else:
+            data = req.get_json(silent=True)
+            if not isinstance(data, dict) or not isinstance(data.get("users", []), list):
+                raise UserImportError('Expected {"users": [...]}')
+            entries = data.get("users", [])
+
+        limit = self.app.config["USER_IMPORT_MAX_USERS"]
+        users = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                raise UserImportError("Each user must be an object")
+            users.append(entry)
+            if len(users) > limit:
+                raise UserImportError(f"At most {limit} users can be imported at once")
+        return users
+
+    @staticmethod
+    def existing_emails(emails):
+        found = set()
+        emails = list(emails)
+        for start in range(0, len(emails), EMAIL_LOOKUP_CHUNK):
+            chunk = emails[start:start + EMAIL_LOOKUP_CHUNK]
+            found.update(email for (email,) in db.session.query(User.email).filter(User.email.in_(chunk)))
+        return found
+
+    def import_users(self, entries):
+        """
+        Crea los usuarios que no existen. Retorna (creados, omitidos): los
+        creados con su contraseña temporal y los omitidos con el motivo.
+        """
+        skipped = []
+        candidates = {}
+        for entry in entries:
+            email = (entry.get("email") or "").strip()
+            if not email:
+                skipped.append({"email": email, "reason": "missing email"})
+            elif email in candidates:
+                skipped.append({"email": email, "reason": "duplicate in import"})
+            else:
+                candidates[email] = entry
+
+        existing = self.existing_emails(candidates)
+        new = [(email, entry) for email, entry in candidates.items() if email not in existing]
+        skipped += [{"email": email, "reason": "already exists"} for email in candidates if email in existing]
+
+        passwords = [secrets.token_urlsafe(8) for _ in new]
+        hashes = self.hash_all(passwords)
+        rows = [
+            {
+                "email": email,
+                "first_name": entry.get("first_name", ""),
+                "last_name": entry.get("last_name", ""),
+                "password_hash": password_hash,
+                "is_admin": False,
+                "force_password_change": True,  # Obligará a cambiar en su 1er login
+            }
+            for (email, entry), password_hash in zip(new, hashes)
+        ]
+        if rows:
+            try:
+                db.session.execute(User.__table__.insert(), rows)
+                db.session.commit()
+            except IntegrityError:
+                # Otra importación creó alguno de estos correos mientras tanto
+                db.session.rollback()
+                taken = self.existing_emails(row["email"] for row in rows)
+                skipped += [{"email": email, "reason": "already exists"} for email in sorted(taken)]
+                keep = [i for i, row in enumerate(rows) if row["email"] not in taken]
+                rows = [rows[i] for i in keep]
+                passwords = [passwords[i] for i in keep]
+                if rows:
+                    db.session.execute(User.__table__.insert(), rows)
+                    db.session.commit()
+
+        created = [
+            {"email": row["email"], "temp_password": password}
+            for row, password in zip(rows, passwords)
+        ]
+        return created, skipped
+
+
+user_importer = UserImporter()
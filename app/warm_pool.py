@@ -0,0 +1,178 @@
+import os
+import threading
+
+import docker
+
+from .container_registry import container_registry
+from .image_cache import CONTEXT_HASH_LABEL, image_build_cache
+from .models import Exercise, ExerciseWarmPool
+from .placement import LAB_CONTAINER_OPTIONS, placement
+
+# Etiqueta con el id del ejercicio en los contenedores creados para el pool
+WARM_POOL_LABEL = "labcentral.warm-pool"
+
+
+def warm_container_name(exercise_id, slot):
+    return f"warm-exercise-{exercise_id}-{slot}"
+
+
+class WarmPool:
+    """
+    Contenedores precalentados por ejercicio: ya creados, corriendo en
+    `lab_app_net` y sin asignar. Al iniciar un ejercicio se toma uno y se
+    renombra a `user-{id}-exercise-{id}`, y el pool se rellena en segundo
+    plano.
+
+    Cada contenedor ocupa un "slot" con nombre fijo
+    (`warm-exercise-{id}-{slot}`), de modo que si varios workers rellenan el
+    mismo pool a la vez Docker rechaza los nombres repetidos en lugar de
+    crear contenedores de más (y, con varios hosts, el relleno siguiente
+    elimina el duplicado). Cada slot se crea en el host que elige
+    `placement`. El tamaño de cada pool se guarda en `ExerciseWarmPool` y lo
+    ajustan los administradores.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._guard = threading.Lock()
+        self._refilling = set()
+        self._pending = set()
+
+    def init_app(self, app):
+        app.config.setdefault("WARM_POOL_MAX_SIZE", int(os.getenv("WARM_POOL_MAX_SIZE", "50")))
+        self.app = app
+        app.extensions["warm_pool"] = self
+
+    # -------------------------
+    #   CONSULTAS
+    # -------------------------
+
+    def containers(self, exercise_id):
+        """Contenedores del pool en todos los hosts: lista de (host, contenedor)."""
+        # Un contenedor asignado conserva la etiqueta, pero ya no el nombre de slot
+        prefix = warm_container_name(exercise_id, "")
+        return [
+            (host, c)
+            for host, c in placement.list_containers(all=True, filters={"label": f"{WARM_POOL_LABEL}={exercise_id}"})
+            if c.name.startswith(prefix)
+        ]
+
+    def ready_count(self, exercise_id):
+        return sum(1 for _, c in self.containers(exercise_id) if c.status == "running")
+
+    # -------------------------
+    #   ASIGNACIÓN
+    # -------------------------
+
+    def claim(self, exercise_id, context_hash, container_name):
+        """
+        Renombra un contenedor precalentado a `container_name` y retorna
+        (host, contenedor), o (None, None) si el pool está vacío. Solo se
+        toman contenedores construidos desde el contexto `context_hash`
+        (los contenedores heredan las etiquetas de su imagen).
+        """
+        for host, container in self.containers(exercise_id):
+            if container.status != "running" or (container.labels or {}).get(CONTEXT_HASH_LABEL) != context_hash:
+                continue
+            slot_name = container.name
+            try:
+                container.rename(container_name)
+            except docker.errors.APIError:
+                # Otro worker lo tomó primero
+                continue
+            placement.rename(slot_name, container_name, host)
+            container_registry.refresh(container_name, host)
+            return host, container
+        return None, None
+
+    # -------------------------
+    #   RELLENO
+    # -------------------------
+
+    def refill_async(self, exercise_id):
+        """
+        Rellena el pool en un hilo aparte. Si ya hay un relleno en curso para
+        el ejercicio, se repite al terminar en lugar de lanzar otro hilo.
+        """
+        with self._guard:
+            if exercise_id in self._refilling:
+                self._pending.add(exercise_id)
+                return
+            self._refilling.add(exercise_id)
+        threading.Thread(target=self._refill_loop, args=(exercise_id,), daemon=True).start()
+
+    def _refill_loop(self, exercise_id):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.refill(exercise_id)
+            except Exception as e:
+                self.app.logger.error(f"Warm pool refill for exercise {exercise_id} failed: {str(e)}")
+            with self._guard:
+                if exercise_id in self._pending:
+                    self._pending.discard(exercise_id)
+                    continue
+                self._refilling.discard(exercise_id)
+                return
+
+    def refill(self, exercise_id):
+        """
+        Deja el pool con exactamente `size` contenedores corriendo sobre la
+        imagen actual: elimina los sobrantes, detenidos o de una imagen
+        anterior, y crea los que faltan.
+        """
+        exercise = Exercise.query.get(exercise_id)
+        pool = ExerciseWarmPool.query.filter_by(exercise_id=exercise_id).first()
+        size = pool.size if pool and exercise else 0
+
+        context_hash = image_build_cache.context_hash(exercise.dockerfile_path) if size else None
+        images = {}
+
+        def image_on(host):
+            # La imagen se construye (si hace falta) solo en los hosts donde se crean contenedores
+            if host.name not in images:
+                images[host.name], _ = image_build_cache.ensure_image(
+                    host.client, f"exercise-{exercise_id}", exercise.dockerfile_path
+                )
+            return images[host.name]
+
+        slots = {warm_container_name(exercise_id, slot) for slot in range(size)}
+        occupied = set()
+        removed = []
+        for host, container in self.containers(exercise_id):
+            stale = not size or (container.labels or {}).get(CONTEXT_HASH_LABEL) != context_hash
+            if container.name in slots and container.name not in occupied and container.status == "running" and not stale:
+                occupied.add(container.name)
+                continue
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError:
+                pass
+            if container.name not in slots:
+                removed.append(container.name)
+        placement.forget(*removed)
+
+        for name in sorted(slots - occupied):
+            host = placement.choose()
+            try:
+                host.client.containers.run(
+                    image_on(host).id,
+                    detach=True,
+                    name=name,
+                    labels={WARM_POOL_LABEL: str(exercise_id)},
+                    **LAB_CONTAINER_OPTIONS,
+                )
+            except docker.errors.APIError as e:
+                if e.status_code != 409:
+                    raise
+                # Otro worker ya creó este slot
+                continue
+            placement.remember(name, host)
+
+    def refill_all(self):
+        """Lanza el relleno de todos los pools configurados (al iniciar)."""
+        for pool in ExerciseWarmPool.query.filter(ExerciseWarmPool.size > 0).all():
+            self.refill_async(pool.exercise_id)
+
+
+warm_pool = WarmPool()
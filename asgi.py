@@ -0,0 +1,7 @@
+from app import create_app
+from app.asgi_proxy import AsyncExerciseProxy
+
+# Modo asíncrono: el proxy de ejercicios (HTTP y WebSocket) corre en el
+# event loop y el resto de la API se delega a la aplicación Flask.
+#   uvicorn asgi:app --host 0.0.0.0 --port 5001
+app = AsyncExerciseProxy(create_app())
@@ -0,0 +1,149 @@
+"""
+Revisa que las consultas más frecuentes de los alumnos usen índices.
+
+Crea una base SQLite en memoria con el esquema de `app.models`, la llena
+con una cohorte sintética, y para cada consulta muestra el plan
+(`EXPLAIN QUERY PLAN`) y el tiempo promedio. Termina con código 1 si
+alguna recorre una tabla completa.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/query_plans.py [--students 400] [--exercises 20] [--questions 15]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import create_engine, or_, select, text
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import db  # noqa: E402
+from app.models import (  # noqa: E402
+    CompletedExercise, ExerciseAnswer, ExerciseGroup, ExerciseQuestion,
+    GroupExerciseAnswer, User
+)
+
+REPETITIONS = 200
+
+
+def seed(session, students, exercises, questions):
+    rng = random.Random(42)
+    session.execute(User.__table__.insert(), [
+        {"id": i, "email": f"student{i}@example.com", "password_hash": "x"}
+        for i in range(1, students + 1)
+    ])
+    session.execute(ExerciseQuestion.__table__.insert(), [
+        {"id": e * questions + q, "exercise_id": e, "question_text": f"Q{q}", "score": 1}
+        for e in range(1, exercises + 1) for q in range(questions)
+    ])
+    groups, individual, group_answers, completed = [], [], [], []
+    for e in range(1, exercises + 1):
+        students_ids = list(range(1, students + 1))
+        rng.shuffle(students_ids)
+        # La mitad trabaja en parejas y la otra mitad sola
+        half = students // 2 - (students // 2) % 2
+        for i in range(0, half, 2):
+            groups.append({"id": len(groups) + 1, "exercise_id": e,
+                           "leader_id": students_ids[i], "partner_id": students_ids[i + 1]})
+            for q in range(questions):
+                group_answers.append({"group_id": len(groups), "question_id": e * questions + q,
+                                      "answer_text": "respuesta"})
+        for user_id in students_ids[half:]:
+            for q in range(questions):
+                individual.append({"user_id": user_id, "question_id": e * questions + q,
+                                   "answer_text": "respuesta"})
+        completed += [{"user_id": u, "exercise_id": e} for u in students_ids[: students // 3]]
+    session.execute(ExerciseGroup.__table__.insert(), groups)
+    session.execute(ExerciseAnswer.__table__.insert(), individual)
+    session.execute(GroupExerciseAnswer.__table__.insert(), group_answers)
+    session.execute(CompletedExercise.__table__.insert(), completed)
+    session.commit()
+
+
+def hot_queries(user_id, exercise_id, group_id, question_id):
+    """Consultas de los endpoints de alumno y de los listados de administración."""
+    return {
+        "group of a student in an exercise": select(ExerciseGroup).where(
+            ExerciseGroup.exercise_id == exercise_id,
+            or_(ExerciseGroup.leader_id == user_id, ExerciseGroup.partner_id == user_id),
+        ),
+        "individual answer by (user, question)": select(ExerciseAnswer).where(
+            ExerciseAnswer.user_id == user_id, ExerciseAnswer.question_id == question_id,
+        ),
+        "group answer by (group, question)": select(GroupExerciseAnswer).where(
+            GroupExerciseAnswer.group_id == group_id, GroupExerciseAnswer.question_id == question_id,
+        ),
+        "answers of a group": select(GroupExerciseAnswer).where(
+            GroupExerciseAnswer.group_id == group_id,
+        ),
+        "student's answers in an exercise": select(ExerciseAnswer).join(ExerciseQuestion).where(
+            ExerciseQuestion.exercise_id == exercise_id, ExerciseAnswer.user_id == user_id,
+        ),
+        "answers of a question": select(ExerciseAnswer).where(
+            ExerciseAnswer.question_id == question_id,
+        ),
+        "completed exercises of a student": select(CompletedExercise).where(
+            CompletedExercise.user_id == user_id,
+        ),
+        "admin listing of an exercise": select(ExerciseAnswer.id, User.email).join(
+            ExerciseQuestion, ExerciseQuestion.id == ExerciseAnswer.question_id
+        ).outerjoin(User, User.id == ExerciseAnswer.user_id).where(
+            ExerciseQuestion.exercise_id == exercise_id,
+        ),
+    }
+
+
+def full_scans(plan):
+    """Pasos del plan que recorren una tabla sin índice."""
+    return [
+        detail for detail in plan
+        if detail.startswith("SCAN") and "USING" not in detail
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=400)
+    parser.add_argument("--exercises", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=15)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    failed = []
+    with Session(engine) as session:
+        seed(session, args.students, args.exercises, args.questions)
+        session.execute(text("ANALYZE"))
+        exercise_id = args.exercises // 2 or 1
+        group = session.scalars(select(ExerciseGroup).where(ExerciseGroup.exercise_id == exercise_id)).first()
+        question_id = exercise_id * args.questions
+        queries = hot_queries(group.partner_id, exercise_id, group.id, question_id)
+
+        for name, stmt in queries.items():
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in session.execute(text("EXPLAIN QUERY PLAN " + sql))]
+            started = time.perf_counter()
+            for _ in range(REPETITIONS):
+                session.execute(text(sql)).fetchall()
+            elapsed_us = (time.perf_counter() - started) / REPETITIONS * 1_000_000
+            scans = full_scans(plan)
+            status = "FULL SCAN" if scans else "ok"
+            if scans:
+                failed.append(name)
+            print(f"{name:40s} {elapsed_us:9.1f} us  {status}")
+            for detail in plan:
+                print(f"    {detail}")
+
+    if failed:
+        print(f"\n{len(failed)} queries scan a whole table: {', '.join(failed)}")
+        return 1
+    print("\nAll hot queries use an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
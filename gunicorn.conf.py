@@ -0,0 +1,19 @@
+# Configuración que gunicorn carga automáticamente desde el directorio de trabajo
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    """Vacía el directorio de métricas de Prometheus de ejecuciones anteriores."""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Descarta los gauges del worker que ha terminado."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -42,15 +42,7 @@ function BulkUserCreation() {
       });
       const data = await response.json();
       if (response.ok) {
-        if (data.created && data.created.length > 0) {
-          let msg = "Usuarios creados exitosamente:\n";
-          data.created.forEach((u) => {
-            msg += `${u.email}: ${u.temp_password}\n`;
-          });
-          setBulkUsersMessage(msg);
-        } else {
-          setBulkUsersMessage("No se crearon usuarios nuevos.");
-        }
+        showResult(data);
         setBulkUsers([]);
       } else {
         setBulkUsersMessage(data.error || "Error al crear usuarios.");
@@ -61,6 +53,54 @@ function BulkUserCreation() {
     }
   };
 
+  const showResult = (data) => {
+    let msg = "";
+    if (data.created && data.created.length > 0) {
+      msg = "Usuarios creados exitosamente:\n";
+      data.created.forEach((u) => {
+        msg += `${u.email}: ${u.temp_password}\n`;
+      });
+    } else {
+      msg = "No se crearon usuarios nuevos.\n";
+    }
+    if (data.skipped && data.skipped.length > 0) {
+      msg += `\nOmitidos (${data.skipped.length}):\n`;
+      data.skipped.forEach((u) => {
+        msg += `${u.email || "(sin correo)"}: ${u.reason}\n`;
+      });
+    }
+    setBulkUsersMessage(msg);
+  };
+
+  // CSV con columnas email, first_name, last_name (con o sin encabezado)
+  const handleCsvUpload = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = "";
+    if (!file) return;
+    const formData = new FormData();
+    formData.append("file", file);
+    setBulkUsersMessage("Importando usuarios...");
+    try {
+      const response = await fetch(`${API_URL}/api/admin/bulk_create_users`, {
+        method: "POST",
+        headers: {
+          "Authorization": "Bearer " + localStorage.getItem("admin_token"),
+        },
+        credentials: "include",
+        body: formData,
+      });
+      const data = await response.json();
+      if (response.ok) {
+        showResult(data);
+      } else {
+        setBulkUsersMessage(data.error || "Error al importar el CSV.");
+      }
+    } catch (error) {
+      console.error("Error al importar CSV:", error);
+      setBulkUsersMessage("Error en la petición.");
+    }
+  };
+
   return (
     <div className="card p-4">
       <h2 className="text-lg font-semibold mb-4">Creación Masiva de Usuarios (Admin)</h2>
@@ -127,6 +167,12 @@ function BulkUserCreation() {
       >
         Crear Usuarios en Cola
       </button>
+      <div className="mt-4">
+        <label className="block text-sm mb-1">
+          O importa un archivo CSV (columnas: email, first_name, last_name):
+        </label>
+        <input type="file" accept=".csv,text/csv" onChange={handleCsvUpload} />
+      </div>
       {bulkUsersMessage && (
         <pre className="mt-2 text-sm whitespace-pre-wrap">
           {bulkUsersMessage}
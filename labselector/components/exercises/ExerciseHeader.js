@@ -1,6 +1,7 @@
 export default function ExerciseHeader({
   exercise,
   containerStatus,
+  queuePosition,
   startExercise,
   stopExercise,
 }) {
@@ -17,7 +18,7 @@ export default function ExerciseHeader({
         )}
         {containerStatus === "starting" && (
           <button disabled className="button bg-green-400 cursor-not-allowed">
-            Starting...
+            {queuePosition ? `In queue (#${queuePosition})...` : "Starting..."}
           </button>
         )}
         {containerStatus === "running" && (
@@ -7,6 +7,7 @@ export default function useExerciseData(exerciseId, router) {
   const [exercise, setExercise] = useState(null);
   const [questions, setQuestions] = useState([]);
   const [containerStatus, setContainerStatus] = useState("stopped");
+  const [queuePosition, setQueuePosition] = useState(null);
   const [answers, setAnswers] = useState({});
   const [myServerAnswers, setMyServerAnswers] = useState({});
   const [myGroupScores, setMyGroupScores] = useState({});
@@ -93,6 +94,27 @@ export default function useExerciseData(exerciseId, router) {
   }, [exerciseId, router]);
 
   /* ---------------- contenedor docker ------------------ */
+  // Estados de un inicio/detención en curso (ver /api/exercise/<id>/status)
+  const STARTING_STATES = ["queued", "building", "starting"];
+  const JOB_POLL_INTERVAL = 1500;
+
+  // Consulta el estado hasta que termine el trabajo `jobId`
+  const waitForJob = async (jobId) => {
+    for (;;) {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+      const resp = await fetch(`${API_URL}/api/exercise/${exerciseId}/status`, {
+        credentials: "include",
+      });
+      const data = await resp.json();
+      // Posición en la cola de admisión mientras el host está lleno
+      setQueuePosition(data.job && data.job.queue_position ? data.job.queue_position : null);
+      if (!data.job || data.job.id !== jobId) return data;
+      if (!STARTING_STATES.includes(data.job.state) && data.job.state !== "stopping") {
+        return data;
+      }
+    }
+  };
+
   const startExercise = async () => {
     setContainerStatus("starting");
     const r = await fetch(`${API_URL}/api/exercise/${exerciseId}/start`, {
@@ -100,17 +122,23 @@ export default function useExerciseData(exerciseId, router) {
       credentials: "include",
     });
     const d = await r.json();
-    if (r.ok) {
-      if (d.proxy_url) {
-        setTimeout(() => {
-          window.open(`${API_URL}${d.proxy_url}`, "_blank");
-          setContainerStatus("running");
-        }, 3000);
-      } else setContainerStatus("running");
-    } else {
-      alert(d.error || "Error");
+    if (!r.ok) {
+      alert(d.error || d.message || "Error");
       setContainerStatus("stopped");
+      return;
     }
+    if (r.status === 202) {
+      // El contenedor se construye/inicia en segundo plano
+      setQueuePosition(d.queue_position || null);
+      const status = await waitForJob(d.job_id);
+      if (status.job && status.job.state === "failed") {
+        alert(status.job.error || "Error");
+        setContainerStatus("stopped");
+        return;
+      }
+    }
+    if (d.proxy_url) window.open(`${API_URL}${d.proxy_url}`, "_blank");
+    setContainerStatus("running");
   };
 
   const stopExercise = async () => {
@@ -119,10 +147,16 @@ export default function useExerciseData(exerciseId, router) {
       method: "POST", 
       credentials: "include" 
     });
-    if (r.ok) {
-      setContainerStatus("stopped");
-    } else {
+    if (!r.ok) {
       setContainerStatus("running");
+      return;
+    }
+    const d = await r.json();
+    const status = await waitForJob(d.job_id);
+    if (status.job && status.job.state === "failed") {
+      setContainerStatus("running");
+    } else {
+      setContainerStatus("stopped");
     }
   };
 
@@ -132,8 +166,9 @@ export default function useExerciseData(exerciseId, router) {
         credentials: "include",
       });
       const data = await resp.json();
-      // data.status = "running" | "stopped" | "not_found"...
-      setContainerStatus(data.status || "stopped");
+      // data.status = "running" | "stopped" | "not_found" | estado del trabajo en curso
+      if (STARTING_STATES.includes(data.status)) setContainerStatus("starting");
+      else setContainerStatus(data.status || "stopped");
     } catch (error) {
       console.error("No se pudo obtener estado de contenedor:", error);
       setContainerStatus("stopped");
@@ -311,6 +346,7 @@ export default function useExerciseData(exerciseId, router) {
     exercise,
     questions,
     containerStatus,
+    queuePosition,
     startExercise,
     stopExercise,
     answers,
@@ -20,6 +20,7 @@ export default function ExerciseDetail() {
     exercise,
     questions,
     containerStatus,
+    queuePosition,
     startExercise,
     stopExercise,
     answers,
@@ -115,6 +116,7 @@ export default function ExerciseDetail() {
         <ExerciseHeader
           exercise={exercise}
           containerStatus={containerStatus}
+          queuePosition={queuePosition}
           startExercise={startExercise}
           stopExercise={stopExercise}
           darkMode={darkMode}
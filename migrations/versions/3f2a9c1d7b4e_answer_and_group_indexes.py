@@ -0,0 +1,70 @@
+"""Indexes for group and answer lookups; one answer per user/group and question
+
+Revision ID: 3f2a9c1d7b4e
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b4e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (tabla, nombre, columnas, único)
+INDEXES = [
+    ('exercise_group', 'ix_exercise_group_exercise_leader', ['exercise_id', 'leader_id'], False),
+    ('exercise_group', 'ix_exercise_group_exercise_partner', ['exercise_id', 'partner_id'], False),
+    ('exercise_answer', 'uq_exercise_answer_user_question', ['user_id', 'question_id'], True),
+    ('exercise_answer', 'ix_exercise_answer_question', ['question_id'], False),
+    ('group_exercise_answer', 'uq_group_exercise_answer_group_question', ['group_id', 'question_id'], True),
+    ('group_exercise_answer', 'ix_group_exercise_answer_question', ['question_id'], False),
+    ('completed_exercise', 'ix_completed_exercise_user_exercise', ['user_id', 'exercise_id'], False),
+    ('exercise_question', 'ix_exercise_question_exercise_id', ['exercise_id'], False),
+]
+
+# (tabla, índice único, columnas): las respuestas repetidas impedirían crearlo
+DUPLICATES = [
+    ('exercise_answer', 'uq_exercise_answer_user_question', ['user_id', 'question_id']),
+    ('group_exercise_answer', 'uq_group_exercise_answer_group_question', ['group_id', 'question_id']),
+]
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # Las tablas pueden venir de `db.create_all()`, que ya crea estos índices
+    bind = op.get_bind()
+    for table, name, columns in DUPLICATES:
+        if name in existing_indexes(table):
+            continue
+        # De cada par se conserva la respuesta calificada o, si no hay, la más
+        # reciente (la que se editó por última vez), y se informan las borradas
+        key = ', '.join(columns)
+        duplicates = [row[0] for row in bind.execute(sa.text(
+            f"SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+            f"PARTITION BY {key} ORDER BY CASE WHEN score IS NULL THEN 1 ELSE 0 END, id DESC"
+            f") AS position FROM {table}) ranked WHERE position > 1"
+        ))]
+        if duplicates:
+            bind.execute(sa.text(f"DELETE FROM {table} WHERE id IN :ids").bindparams(
+                sa.bindparam('ids', expanding=True)
+            ), {'ids': duplicates})
+            print(f"Removed {len(duplicates)} duplicate rows from {table} (ids: {sorted(duplicates)})")
+
+    for table, name, columns, unique in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for table, name, _, _ in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)